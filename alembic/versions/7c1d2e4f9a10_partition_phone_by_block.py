@@ -0,0 +1,68 @@
+"""Partition phone by block
+
+Revision ID: 7c1d2e4f9a10
+Revises: 39c38b78c51c
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '7c1d2e4f9a10'
+down_revision = '39c38b78c51c'
+branch_labels = None
+depends_on = None
+
+BLOCKS = (3, 4, 8, 9)
+BLOCK_MP = 1000000000
+
+
+def upgrade() -> None:
+    op.rename_table('phone', 'phone_old')
+    op.execute('ALTER INDEX phone_pkey RENAME TO phone_old_pkey')
+    op.create_table('phone',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('phone_id_seq'::regclass)"), nullable=False),
+    sa.Column('block', sa.SmallInteger(), nullable=False),
+    sa.Column('range', postgresql.INT8RANGE(), nullable=False),
+    sa.Column('operator_id', sa.BigInteger(), nullable=True),
+    sa.Column('region_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['operator_id'], ['operator.id'], ),
+    sa.ForeignKeyConstraint(['region_id'], ['region.id'], ),
+    sa.PrimaryKeyConstraint('id', 'block'),
+    postgresql_partition_by='LIST (block)'
+    )
+    for block in BLOCKS:
+        op.execute(
+            f'CREATE TABLE phone_{block} PARTITION OF phone '
+            f'(EXCLUDE USING gist (range WITH &&)) FOR VALUES IN ({block})'
+        )
+    op.execute(
+        'INSERT INTO phone (id, block, range, operator_id, region_id) '
+        f'SELECT id, lower(range) / {BLOCK_MP}, range, operator_id, '
+        'region_id FROM phone_old'
+    )
+    op.execute('ALTER SEQUENCE phone_id_seq OWNED BY phone.id')
+    op.drop_table('phone_old')
+
+
+def downgrade() -> None:
+    op.rename_table('phone', 'phone_new')
+    op.execute('ALTER INDEX phone_pkey RENAME TO phone_new_pkey')
+    op.create_table('phone',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('phone_id_seq'::regclass)"), nullable=False),
+    sa.Column('range', postgresql.INT8RANGE(), nullable=False),
+    sa.Column('operator_id', sa.BigInteger(), nullable=True),
+    sa.Column('region_id', sa.Integer(), nullable=True),
+    postgresql.ExcludeConstraint((sa.column('range'), '&&'), using='gist'),
+    sa.ForeignKeyConstraint(['operator_id'], ['operator.id'], ),
+    sa.ForeignKeyConstraint(['region_id'], ['region.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        'INSERT INTO phone (id, range, operator_id, region_id) '
+        'SELECT id, range, operator_id, region_id FROM phone_new'
+    )
+    op.execute('ALTER SEQUENCE phone_id_seq OWNED BY phone.id')
+    op.drop_table('phone_new')
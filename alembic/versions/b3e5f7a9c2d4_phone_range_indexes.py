@@ -0,0 +1,33 @@
+"""Phone range indexes for keyset pagination
+
+Revision ID: b3e5f7a9c2d4
+Revises: 7c1d2e4f9a10
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b3e5f7a9c2d4'
+down_revision = '7c1d2e4f9a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('phone_lower_idx', 'phone', [sa.text('lower(range)')])
+    op.create_index(
+        'phone_operator_id_lower_idx', 'phone',
+        ['operator_id', sa.text('lower(range)')]
+    )
+    op.create_index(
+        'phone_region_id_lower_idx', 'phone',
+        ['region_id', sa.text('lower(range)')]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('phone_region_id_lower_idx', table_name='phone')
+    op.drop_index('phone_operator_id_lower_idx', table_name='phone')
+    op.drop_index('phone_lower_idx', table_name='phone')
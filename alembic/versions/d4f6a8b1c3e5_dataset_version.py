@@ -0,0 +1,28 @@
+"""Dataset version per block
+
+Revision ID: d4f6a8b1c3e5
+Revises: b3e5f7a9c2d4
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6a8b1c3e5'
+down_revision = 'b3e5f7a9c2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('dataset_version',
+    sa.Column('block', sa.SmallInteger(), autoincrement=False, nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('block')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('dataset_version')
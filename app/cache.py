@@ -0,0 +1,121 @@
+"""Кэш результатов поиска номеров в Redis. Ключи содержат версию блока
+нумерации, поэтому загрузка одного файла реестра делает недоступными
+только ответы по его блоку. Лимит памяти и политика вытеснения задаются
+в конфигурации Redis кэша, а не из API: в общем Redis лежат очереди
+Celery, ETag, версии и блокировки импорта, которые вытеснять нельзя.
+"""
+import json
+import logging
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud
+from .coalescer import lookup_coalescer
+from .config import settings
+from .metrics import Counter, Gauge
+from .models import BLOCK_MP
+from .versions import RegistryVersions
+
+# Значение для номеров, которых нет в реестре
+NOT_FOUND = ""
+
+
+class LookupCache:
+    """Read-through кэш перед crud.get_info"""
+
+    def __init__(self, db: int = 0) -> None:
+        """Метод конструктора
+
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        self.redis = aioredis.StrictRedis(
+            host=settings.lookup_cache_host or settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        self.hits = 0
+        self.misses = 0
+        self.versions = RegistryVersions(db)
+
+    async def get_info(self, session: AsyncSession, phone_num: int):
+        """Ищет номер в кэше, при промахе - в базе данных
+
+        :param session: Сессия базы данных
+        :type session: AsyncSession
+        :param phone_num: Десятизначный номер телефона
+        :type phone_num: int
+        :return: (ИНН, оператор, регион, подрегион) или None
+        :rtype: tuple | None
+        """
+        try:
+            block = phone_num // BLOCK_MP
+            version = (await self.versions.get()).get(block, 0)
+            key = f"lookup:{block}:{version}:{phone_num}"
+            cached = await self.redis.get(key)
+        except RedisError as err:
+            logging.warning(f"Ошибка чтения кэша: {err}")
+            return await crud.get_info(session, phone_num)
+        if cached is not None:
+            self.hits += 1
+            return tuple(json.loads(cached)) if cached else None
+        self.misses += 1
+        if settings.lookup_coalesce:
+            result = await lookup_coalescer.get_info(phone_num)
+        else:
+            result = await crud.get_info(session, phone_num)
+        try:
+            await self.redis.set(
+                key,
+                json.dumps(tuple(result), ensure_ascii=False)
+                if result
+                else NOT_FOUND,
+                ex=settings.lookup_cache_ttl,
+            )
+        except RedisError as err:
+            logging.warning(f"Ошибка записи в кэш: {err}")
+        return tuple(result) if result else None
+
+    async def stats(self) -> dict:
+        """Возвращает счётчики попаданий и настройки кэша
+
+        :return: Статистика кэша
+        :rtype: dict
+        """
+        total = self.hits + self.misses
+        memory = await self.redis.info("memory")
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "ttl": settings.lookup_cache_ttl,
+            "maxmemory": memory.get("maxmemory"),
+            "maxmemory_policy": memory.get("maxmemory_policy"),
+            "used_memory": memory.get("used_memory"),
+        }
+
+    def metrics(self) -> list:
+        """Возвращает метрики кэша для /metrics
+
+        :return: Счётчики обращений и доля попаданий
+        :rtype: list[Counter]
+        """
+        requests = Counter(
+            "atrax_lookup_cache_requests_total",
+            "Обращения к кэшу поиска",
+            ("result",),
+        )
+        requests.inc("hit", amount=self.hits)
+        requests.inc("miss", amount=self.misses)
+        ratio = Gauge(
+            "atrax_lookup_cache_hit_ratio", "Доля попаданий в кэш поиска"
+        )
+        total = self.hits + self.misses
+        ratio.set(self.hits / total if total else 0.0)
+        return [requests, ratio]
+
+
+lookup_cache = LookupCache()
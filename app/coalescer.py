@@ -0,0 +1,130 @@
+"""Объединение одиночных запросов поиска номеров в пакетные. Номера,
+запрошенные одновременно, ищутся одним запросом crud.get_info_batch
+через одно соединение, результаты раздаются ожидающим запросам.
+"""
+import asyncio
+from typing import Callable
+
+from . import crud
+from .config import settings
+from .metrics import Counter
+from .replicas import replica_router
+
+
+class LookupCoalescer:
+    """Собирает номера в пакет и ищет их одним запросом. Пока в базу не
+    отправлен ни один пакет, накопленные номера уходят на следующей
+    итерации цикла событий, иначе ждут не дольше окна или до
+    заполнения пакета.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        window: float = None,
+        max_batch: int = None,
+    ) -> None:
+        """Метод конструктора
+
+        :param session_factory: Фабрика сессий базы данных, например
+            sessionmaker или ReplicaRouter.session
+        :type session_factory: Callable
+        :param window: Окно сбора пакета, сек,
+            по умолчанию lookup_coalesce_window
+        :type window: float, optional
+        :param max_batch: Наибольший размер пакета,
+            по умолчанию lookup_coalesce_max_batch
+        :type max_batch: int, optional
+        """
+        self.session_factory = session_factory
+        self.window = window or settings.lookup_coalesce_window
+        self.max_batch = max_batch or settings.lookup_coalesce_max_batch
+        self.lookups = 0
+        self.batches = 0
+        self._pending = {}
+        self._timer = None
+        self._in_flight = 0
+        self._tasks = set()
+
+    async def get_info(self, phone_num: int):
+        """Ищет номер в составе пакета
+
+        :param phone_num: Десятизначный номер телефона
+        :type phone_num: int
+        :return: (ИНН, оператор, регион, подрегион) или None
+        :rtype: tuple | None
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(phone_num, []).append(future)
+        self.lookups += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        else:
+            self._schedule()
+        return await future
+
+    def _schedule(self) -> None:
+        """Планирует отправку накопленных номеров"""
+        if self._timer is None and self._pending:
+            delay = self.window if self._in_flight else 0
+            self._timer = asyncio.get_running_loop().call_later(
+                delay, self._flush
+            )
+
+    def _flush(self) -> None:
+        """Отправляет накопленные номера пакетами по max_batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending = list(self._pending.items())
+        self._pending = {}
+        for start in range(0, len(pending), self.max_batch):
+            stop = start + self.max_batch
+            task = asyncio.create_task(self._run(dict(pending[start:stop])))
+            # Ссылка нужна, чтобы задачу не собрал сборщик мусора
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict) -> None:
+        """Ищет пакет номеров и раздаёт результаты
+
+        :param batch: Номер -> ожидающие его futures
+        :type batch: dict
+        """
+        self._in_flight += 1
+        self.batches += 1
+        try:
+            async with self.session_factory() as session:
+                results = await crud.get_info_batch(session, list(batch))
+        except Exception as err:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(err)
+        else:
+            for futures, result in zip(batch.values(), results):
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            self._schedule()
+
+    def metrics(self) -> list:
+        """Возвращает метрики объединения запросов для /metrics
+
+        :return: Счётчики номеров и пакетов
+        :rtype: list[Counter]
+        """
+        lookups = Counter(
+            "atrax_coalescer_lookups_total", "Номера, искавшиеся пакетами"
+        )
+        lookups.inc(amount=self.lookups)
+        batches = Counter(
+            "atrax_coalescer_batches_total", "Пакетные запросы в базу"
+        )
+        batches.inc(amount=self.batches)
+        return [lookups, batches]
+
+
+lookup_coalescer = LookupCoalescer(replica_router.session)
@@ -1,60 +1,451 @@
-from sqlalchemy import bindparam, delete, select
-from sqlalchemy.dialects.postgresql import Range, insert
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Integer,
+    MetaData,
+    SmallInteger,
+    Table,
+    and_,
+    bindparam,
+    cast,
+    delete,
+    exists,
+    func,
+    literal,
+    select,
+    text,
+    true,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, Range, insert
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
-from .models import Operator, Phone, Region
+from .metrics import DB_SECONDS, timed
+from .models import (
+    BLOCK_MP,
+    RANGE_INDEXES,
+    DatasetVersion,
+    Operator,
+    Phone,
+    Region,
+)
 
+# Ключ advisory lock, под которым собирается теневая секция
+SHADOW_LOCK_KEY = 7203
 
+# Временная таблица для загрузки через COPY, в метаданные моделей не входит
+phone_stage = Table(
+    "phone_stage",
+    MetaData(),
+    Column("ord", Integer),
+    Column("lower", BigInteger),
+    Column("upper", BigInteger),
+    Column("operator_id", BigInteger),
+    Column("region_id", Integer),
+)
+
+# Выражение собирается один раз: текст запроса не меняется между
+# вызовами, и asyncpg берёт подготовленное выражение из кэша соединения.
+GET_INFO_STMT = (
+    select(Operator.inn, Operator.name, Region.name, Region.sub_name)
+    .select_from(Phone)
+    .join(Region)
+    .join(Operator)
+    .where(
+        Phone.block == bindparam("block", type_=SmallInteger),
+        Phone.range.contains(bindparam("phone_num", type_=BigInteger)),
+    )
+)
+
+
+@timed(DB_SECONDS, "get_info")
 async def get_info(session: AsyncSession, phone_num: int):
     result = await session.execute(
-        select(Operator.inn, Operator.name, Region.name, Region.sub_name)
+        GET_INFO_STMT,
+        {"phone_num": phone_num, "block": phone_num // BLOCK_MP},
+    )
+    return result.first()
+
+
+@timed(DB_SECONDS, "get_info_batch")
+async def get_info_batch(session: AsyncSession, phone_nums: list[int]):
+    nums = (
+        func.unnest(cast(bindparam("nums", phone_nums), ARRAY(BigInteger)))
+        .table_valued("num", with_ordinality="ord")
+        .render_derived()
+    )
+    info = (
+        select(
+            Operator.inn,
+            Operator.name.label("operator"),
+            Region.name.label("region"),
+            Region.sub_name,
+        )
         .select_from(Phone)
         .join(Region)
         .join(Operator)
-        .where(Phone.range.contains(phone_num))
+        .where(
+            Phone.block == cast(nums.c.num // BLOCK_MP, SmallInteger),
+            Phone.range.contains(nums.c.num),
+        )
+        .limit(1)
+        .lateral()
     )
-    return result.first()
+    result = await session.execute(
+        select(info.c.inn, info.c.operator, info.c.region, info.c.sub_name)
+        .select_from(nums)
+        .outerjoin(info, true())
+        .order_by(nums.c.ord)
+    )
+    return [None if row[1] is None else tuple(row) for row in result]
+
+
+async def get_operator_ids(conn: AsyncConnection) -> dict:
+    result = await conn.execute(
+        select(Operator.inn, Operator.name, Operator.id)
+    )
+    return {(inn, name): id for inn, name, id in result}
+
+
+async def get_region_ids(conn: AsyncConnection) -> dict:
+    result = await conn.execute(
+        select(Region.name, Region.sub_name, Region.id)
+    )
+    return {(name, sub_name): id for name, sub_name, id in result}
 
 
 async def upsert_operators(conn: AsyncConnection, values: list[dict]):
-    stmt = insert(Operator)
-    stmt = stmt.on_conflict_do_nothing()
-    await conn.execute(stmt, values)
+    # DO NOTHING, а не DO UPDATE: обновление ключевого столбца берёт
+    # FOR UPDATE и ждёт транзакции других импортов, которые ссылаются
+    # на строку внешним ключом. Строки, вставленные другим импортом,
+    # RETURNING не возвращает, их id читаются отдельным запросом.
+    stmt = insert(Operator).values(values)
+    stmt = stmt.on_conflict_do_nothing(constraint="inn_mame_uc")
+    result = await conn.execute(
+        stmt.returning(Operator.inn, Operator.name, Operator.id)
+    )
+    ids = {(inn, name): id for inn, name, id in result}
+    missing = [
+        (value["inn"], value["name"])
+        for value in values
+        if (value["inn"], value["name"]) not in ids
+    ]
+    if missing:
+        result = await conn.execute(
+            select(Operator.inn, Operator.name, Operator.id).where(
+                tuple_(Operator.inn, Operator.name).in_(missing)
+            )
+        )
+        ids.update({(inn, name): id for inn, name, id in result})
+    return ids
 
 
 async def upsert_regions(conn: AsyncConnection, values: list[dict]):
-    stmt = insert(Region)
+    stmt = insert(Region).values(values)
+    stmt = stmt.on_conflict_do_nothing(constraint="name_sub_name_uc")
+    result = await conn.execute(
+        stmt.returning(Region.name, Region.sub_name, Region.id)
+    )
+    ids = {(name, sub_name): id for name, sub_name, id in result}
+    missing = [
+        (value["name"], value["sub_name"])
+        for value in values
+        if (value["name"], value["sub_name"]) not in ids
+    ]
+    if missing:
+        result = await conn.execute(
+            select(Region.name, Region.sub_name, Region.id).where(
+                tuple_(Region.name, Region.sub_name).in_(missing)
+            )
+        )
+        ids.update({(name, sub_name): id for name, sub_name, id in result})
+    return ids
+
+
+async def upsert_phones(
+    conn: AsyncConnection, values: list[dict], table: Table = Phone.__table__
+):
+    stmt = insert(table).values(
+        range=func.int8range(
+            bindparam("lower"), bindparam("upper"), literal("[]")
+        ),
+    )
+    stmt = stmt.on_conflict_do_nothing().returning(table.c.block)
+    return len((await conn.execute(stmt, values)).all())
+
+
+async def reset_stage(conn: AsyncConnection):
+    await conn.execute(
+        text(
+            "CREATE TEMP TABLE IF NOT EXISTS phone_stage ("
+            "ord serial, lower bigint, upper bigint, operator_id bigint, "
+            "region_id integer)"
+        )
+    )
+    await conn.execute(text("TRUNCATE phone_stage RESTART IDENTITY"))
+
+
+async def stage_phones(conn: AsyncConnection, records: list[tuple]):
+    raw_conn = await conn.get_raw_connection()
+    await raw_conn.driver_connection.copy_records_to_table(
+        "phone_stage",
+        records=records,
+        columns=[c.name for c in phone_stage.columns][1:],
+    )
+
+
+def select_staged_phones():
+    stage = phone_stage.alias("s")
+    return select(
+        stage.c.ord,
+        cast(stage.c.lower // BLOCK_MP, SmallInteger).label("block"),
+        func.int8range(stage.c.lower, stage.c.upper, literal("[]")).label(
+            "range"
+        ),
+        stage.c.operator_id,
+        stage.c.region_id,
+    )
+
+
+async def copy_phones(
+    conn: AsyncConnection, records: list[tuple], table: Table = Phone.__table__
+):
+    await reset_stage(conn)
+    await stage_phones(conn, records)
+    staged = select_staged_phones().subquery("staged")
+    stmt = insert(table).from_select(
+        ["block", "range", "operator_id", "region_id"],
+        select(
+            staged.c.block,
+            staged.c.range,
+            staged.c.operator_id,
+            staged.c.region_id,
+        ).order_by(staged.c.ord),
+    )
     stmt = stmt.on_conflict_do_nothing()
-    await conn.execute(stmt, values)
+    return (await conn.execute(stmt)).rowcount
 
 
-async def upsert_phones(conn: AsyncConnection, values: list[dict]):
-    sel_stmt_reg = (
+async def apply_staged_diff(conn: AsyncConnection, block: int) -> dict:
+    phone = Phone.__table__
+    staged = select_staged_phones().subquery("staged")
+    same = and_(
+        phone.c.range == staged.c.range,
+        phone.c.operator_id.is_not_distinct_from(staged.c.operator_id),
+        phone.c.region_id.is_not_distinct_from(staged.c.region_id),
+    )
+    # Сначала удаляются исчезнувшие и изменившиеся диапазоны, иначе
+    # изменившиеся не встанут из-за exclusion constraint.
+    deleted = await conn.execute(
+        delete(phone)
+        .where(phone.c.block == block, ~exists().where(same))
+        .returning(func.lower(phone.c.range), func.upper(phone.c.range))
+    )
+    deleted = set(deleted.all())
+    stmt = insert(phone).from_select(
+        ["block", "range", "operator_id", "region_id"],
         select(
-            Region.id,
-        )
-        .where(
-            Region.name == bindparam("reg_name"),
-            Region.sub_name == bindparam("reg_sub_name"),
+            staged.c.block,
+            staged.c.range,
+            staged.c.operator_id,
+            staged.c.region_id,
         )
-        .scalar_subquery()
+        .where(~exists().where(phone.c.block == block, same))
+        .order_by(staged.c.ord),
     )
-    sel_stmt_oper = (
-        select(
-            Operator.id,
+    stmt = stmt.on_conflict_do_nothing().returning(
+        func.lower(phone.c.range), func.upper(phone.c.range)
+    )
+    inserted = set((await conn.execute(stmt)).all())
+    updated = len(deleted & inserted)
+    return {
+        "inserted": len(inserted) - updated,
+        "deleted": len(deleted) - updated,
+        "updated": updated,
+    }
+
+
+async def get_ranges(conn, lower: int = None, upper: int = None):
+    stmt = select(func.lower(Phone.range), func.upper(Phone.range))
+    if lower is not None:
+        stmt = stmt.where(
+            Phone.block == lower // BLOCK_MP,
+            Phone.range.overlaps(Range(lower, upper)),
         )
-        .where(
-            Operator.inn == bindparam("operator_inn"),
-            Operator.name == bindparam("operator_name"),
+    return (await conn.execute(stmt)).all()
+
+
+async def get_range_start(conn: AsyncConnection, phone_num: int):
+    result = await conn.execute(
+        select(func.lower(Phone.range)).where(
+            Phone.block == phone_num // BLOCK_MP,
+            Phone.range.contains(phone_num),
         )
-        .scalar_subquery()
     )
-    stmt = insert(Phone).values(
-        region_id=sel_stmt_reg, operator_id=sel_stmt_oper
+    return result.scalar()
+
+
+async def get_operator_ids_by_inn(conn: AsyncConnection, inn: int):
+    result = await conn.execute(select(Operator.id).where(Operator.inn == inn))
+    return result.scalars().all()
+
+
+async def get_region_ids_by_name(conn: AsyncConnection, name: str):
+    result = await conn.execute(select(Region.id).where(Region.name == name))
+    return result.scalars().all()
+
+
+async def get_range_page(
+    conn: AsyncConnection,
+    after: int,
+    limit: int,
+    upper: int = None,
+    operator_ids: list[int] = None,
+    region_ids: list[int] = None,
+):
+    lower = func.lower(Phone.range)
+    stmt = select(
+        lower.label("lower"),
+        (func.upper(Phone.range) - 1).label("upper"),
+        Phone.operator_id,
+        Phone.region_id,
+    ).where(lower > after)
+    if upper is not None:
+        stmt = stmt.where(Phone.block == upper // BLOCK_MP, lower <= upper)
+    # По каждому id отдельная ветка: индекс (id, lower(range)) отдаёт
+    # строки ветки уже упорядоченными, ветки сливаются merge append.
+    if operator_ids is not None:
+        if region_ids is not None:
+            stmt = stmt.where(Phone.region_id.in_(region_ids))
+        branches = [stmt.where(Phone.operator_id == id) for id in operator_ids]
+    elif region_ids is not None:
+        branches = [stmt.where(Phone.region_id == id) for id in region_ids]
+    else:
+        branches = [stmt]
+    if not branches:
+        return []
+    branches = [
+        branch.order_by(lower).limit(limit).subquery().select()
+        for branch in branches
+    ]
+    page = union_all(*branches).subquery("page")
+    result = await conn.execute(
+        select(
+            page.c.lower,
+            page.c.upper,
+            Operator.inn,
+            Operator.name,
+            Region.name,
+            Region.sub_name,
+        )
+        .select_from(page)
+        .outerjoin(Operator, Operator.id == page.c.operator_id)
+        .outerjoin(Region, Region.id == page.c.region_id)
+        .order_by(page.c.lower)
+        .limit(limit)
     )
-    stmt = stmt.on_conflict_do_nothing()
-    await conn.execute(stmt, values)
+    return result.all()
 
 
 async def delete_range(conn: AsyncConnection, range: Range):
     await conn.execute(delete(Phone).where(Phone.range.contained_by(range)))
+
+
+def shadow_table(block: int) -> Table:
+    return Phone.__table__.to_metadata(
+        MetaData(), name=f"phone_{block}_shadow"
+    )
+
+
+async def delete_block(conn: AsyncConnection, block: int):
+    # Построчное удаление: TRUNCATE держал бы ACCESS EXCLUSIVE на секции
+    # до конца импорта и блокировал поиск номеров
+    await conn.execute(delete(Phone).where(Phone.block == block))
+
+
+async def lock_shadow(conn: AsyncConnection, block: int):
+    await conn.execute(
+        select(func.pg_advisory_xact_lock(SHADOW_LOCK_KEY, block))
+    )
+
+
+async def create_shadow(conn: AsyncConnection, block: int):
+    shadow = f"phone_{block}_shadow"
+    for stmt in (
+        f"DROP TABLE IF EXISTS {shadow}",
+        f"CREATE TABLE {shadow} (LIKE phone INCLUDING DEFAULTS)",
+        # Индексы, ограничения и CHECK секции создаются заранее, чтобы
+        # ATTACH PARTITION не строил их и не проверял строки.
+        f"ALTER TABLE {shadow} "
+        "ADD PRIMARY KEY (id, block), "
+        f"ADD CHECK (block = {block}), "
+        "ADD EXCLUDE USING gist (range WITH &&), "
+        "ADD FOREIGN KEY (operator_id) REFERENCES operator (id), "
+        "ADD FOREIGN KEY (region_id) REFERENCES region (id)",
+        *(
+            f"CREATE INDEX {shadow}_{name}_idx ON {shadow} ({columns})"
+            for name, columns in RANGE_INDEXES.items()
+        ),
+    ):
+        await conn.execute(text(stmt))
+
+
+async def shadow_exists(conn: AsyncConnection, block: int) -> bool:
+    result = await conn.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"),
+        {"name": f"phone_{block}_shadow"},
+    )
+    return result.scalar()
+
+
+async def swap_shadow(conn: AsyncConnection, block: int):
+    partition = f"phone_{block}"
+    shadow = f"phone_{block}_shadow"
+    for stmt in (
+        f"ALTER TABLE phone DETACH PARTITION {partition}",
+        f"DROP TABLE {partition}",
+        f"ALTER TABLE {shadow} RENAME TO {partition}",
+        f"ALTER TABLE phone ATTACH PARTITION {partition} "
+        f"FOR VALUES IN ({block})",
+    ):
+        await conn.execute(text(stmt))
+    # Возвращаем индексам имена секции, иначе следующая теневая
+    # секция не сможет их создать.
+    result = await conn.execute(
+        text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :partition "
+            "AND starts_with(indexname, :prefix)"
+        ),
+        {"partition": partition, "prefix": f"{shadow}_"},
+    )
+    for name in result.scalars().all():
+        new_name = name.replace(shadow, partition, 1)
+        await conn.execute(
+            text(f'ALTER INDEX "{name}" RENAME TO "{new_name}"')
+        )
+
+
+async def bump_dataset_version(
+    conn: AsyncConnection, block: int, min_version: int = 0
+) -> int:
+    stmt = insert(DatasetVersion).values(block=block, version=min_version)
+    # Версия только растёт, даже если Redis с версиями очищали
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DatasetVersion.block],
+        set_={
+            "version": func.greatest(
+                DatasetVersion.version + 1, stmt.excluded.version
+            ),
+            "updated_at": func.now(),
+        },
+    )
+    result = await conn.execute(stmt.returning(DatasetVersion.version))
+    return result.scalar()
+
+
+async def get_dataset_versions(conn) -> dict:
+    result = await conn.execute(
+        select(DatasetVersion.block, DatasetVersion.version)
+    )
+    return dict(result.all())
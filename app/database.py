@@ -1,21 +1,100 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from .config import settings
+from .metrics import POOL_WAIT_SECONDS
+
+DATABASE_URL = "postgresql+asyncpg://{}:{}@{}:{}/{}".format(
+    settings.postgres_user,
+    settings.postgres_password,
+    settings.postgres_host,
+    settings.postgres_port,
+    settings.postgres_db,
+)
+
+
+class MeteredPool:
+    """Примесь к пулу, которая замеряет получение соединения через
+    публичный Pool.connect: событие checkout срабатывает уже после
+    получения и время ожидания не видит
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        conn = super().connect()
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        return conn
+
+
+class MeteredQueuePool(MeteredPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class MeteredNullPool(MeteredPool, NullPool):
+    pass
 
+
+if settings.db_pooled:
+    pool_kwargs = {
+        "poolclass": MeteredQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+else:
+    pool_kwargs = {"poolclass": MeteredNullPool}
+
+# Engine API: соединения из пула живут между запросами, вместе с ними
+# переиспользуются и подготовленные выражения asyncpg.
 engine = create_async_engine(
-    "postgresql+asyncpg://{}:{}@{}:{}/{}".format(
-        settings.postgres_user,
-        settings.postgres_password,
-        settings.postgres_host,
-        settings.postgres_port,
-        settings.postgres_db,
+    "{}?prepared_statement_cache_size={}".format(
+        DATABASE_URL, settings.db_statement_cache_size
     ),
     echo=False,
+    **pool_kwargs,
+)
+
+
+def create_replica_engine(url: str) -> AsyncEngine:
+    """Engine реплики для чтения с теми же настройками пула, что у
+    engine API
+
+    :param url: DSN реплики
+    :type url: str
+    :return: Engine реплики
+    :rtype: AsyncEngine
+    """
+    return create_async_engine(
+        make_url(url).update_query_dict(
+            {
+                "prepared_statement_cache_size": str(
+                    settings.db_statement_cache_size
+                )
+            }
+        ),
+        echo=False,
+        **pool_kwargs,
+    )
+
+
+# Engine импорта: каждая задача Celery запускает свой event loop через
+# asyncio.run, соединения из пула нельзя переносить между циклами.
+import_engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
     poolclass=NullPool,
 )
 
+
 async_session = sessionmaker(
     engine, expire_on_commit=False, class_=AsyncSession
 )
@@ -1,8 +1,14 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .database import async_session
+from .replicas import replica_router
 
 
 async def get_session() -> AsyncSession:
-    async with async_session() as session:
+    # Поиск читает с актуальной реплики, если они заданы в настройках
+    async with replica_router.session() as session:
         yield session
+
+
+def get_redis_db() -> int:
+    # Номер базы Redis со статусами импорта, тесты подменяют его
+    return 0
@@ -0,0 +1,76 @@
+"""Кэш id операторов и регионов на время импорта файла реестра."""
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from . import crud
+
+
+class DimensionCache:
+    """Словари (ИНН, оператор) -> id и (регион, подрегион) -> id.
+    Загружаются один раз за импорт, в базу пишутся только новые значения.
+    """
+
+    def __init__(self) -> None:
+        """Метод конструктора"""
+        self.operators = None
+        self.regions = None
+
+    async def load(self, conn: AsyncConnection) -> None:
+        """Загружает все операторы и регионы из базы данных
+
+        :param conn: Соединение импорта
+        :type conn: AsyncConnection
+        """
+        self.operators = await crud.get_operator_ids(conn)
+        self.regions = await crud.get_region_ids(conn)
+
+    async def resolve(
+        self, conn: AsyncConnection, batch: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Добавляет в порцию столбцы operator_id и region_id, вставляя
+        в базу операторы и регионы, которых ещё нет в кэше
+
+        :param conn: Соединение импорта
+        :type conn: AsyncConnection
+        :param batch: подготовленная порция данных
+        :type batch: pd.DataFrame
+        :return: порция с id операторов и регионов
+        :rtype: pd.DataFrame
+        """
+        if self.operators is None:
+            await self.load(conn)
+        operators = list(zip(batch["operator_inn"], batch["operator_name"]))
+        # Новые значения вставляются в одном порядке во всех импортах,
+        # чтобы одновременные вставки не ждали друг друга крест-накрест.
+        new_operators = [
+            {"inn": inn, "name": name}
+            for inn, name in sorted(
+                set(operators), key=lambda x: (x[0] is None, x[0] or 0, x[1])
+            )
+            if (inn, name) not in self.operators
+        ]
+        if new_operators:
+            self.operators.update(
+                await crud.upsert_operators(conn, new_operators)
+            )
+        regions = list(zip(batch["reg_name"], batch["reg_sub_name"]))
+        new_regions = [
+            {"name": name, "sub_name": sub_name}
+            for name, sub_name in sorted(set(regions))
+            if (name, sub_name) not in self.regions
+        ]
+        if new_regions:
+            self.regions.update(await crud.upsert_regions(conn, new_regions))
+        # Оператор без ИНН не находился подзапросом по inn = NULL, и у
+        # таких диапазонов operator_id оставался пустым. Поведение
+        # сохраняется, чтобы поиск не вернул ответ без ИНН.
+        batch["operator_id"] = np.array(
+            [
+                None if key[0] is None else self.operators[key]
+                for key in operators
+            ],
+            dtype=object,
+        )
+        batch["region_id"] = [self.regions[key] for key in regions]
+        return batch
@@ -0,0 +1,158 @@
+"""Загрузка файлов реестра в локальный кэш. Файл сохраняется под именем,
+составленным из url и ETag, поэтому повторный разбор неизменившегося
+файла не требует обращения к сети, а прерванная загрузка
+продолжается с места обрыва.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import httpx
+
+from .config import settings
+
+
+class Downloader:
+    """Загружает файлы через общий httpx.AsyncClient"""
+
+    def __init__(self, client: httpx.AsyncClient = None) -> None:
+        """Метод конструктора
+
+        :param client: Клиент http, по умолчанию создаётся свой
+        :type client: httpx.AsyncClient, optional
+        """
+        self._own_client = client is None
+        self.client = client or httpx.AsyncClient(
+            verify=settings.download_verify_ssl,
+            timeout=settings.download_timeout,
+            follow_redirects=True,
+        )
+        self.cache_dir = Path(settings.download_cache_dir)
+
+    async def __aenter__(self) -> "Downloader":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._own_client:
+            await self.client.aclose()
+
+    def get_path(self, url: str, etag: str) -> Path:
+        """Возвращает путь к файлу в кэше
+
+        :param url: url файла
+        :type url: str
+        :param etag: ETag файла
+        :type etag: str
+        :return: путь к файлу
+        :rtype: Path
+        """
+        url_key = hashlib.sha1(url.encode()).hexdigest()[:16]
+        etag_key = hashlib.sha1(etag.encode()).hexdigest()[:16]
+        return self.cache_dir / f"{url_key}-{etag_key}.csv"
+
+    async def _retry(self, func, *args):
+        """Вызывает func с повторами при сетевых ошибках и ответах 5xx"""
+        for attempt in range(settings.download_retries + 1):
+            try:
+                return await func(*args)
+            except (httpx.TransportError, httpx.HTTPStatusError) as err:
+                if (
+                    isinstance(err, httpx.HTTPStatusError)
+                    and err.response.status_code < 500
+                ) or attempt == settings.download_retries:
+                    raise
+                delay = settings.download_backoff * 2**attempt
+                logging.warning(
+                    f"Ошибка загрузки {args[0]}: {err!r}, повтор "
+                    f"через {delay:.1f} с"
+                )
+                await asyncio.sleep(delay)
+
+    async def _head(self, url: str) -> str:
+        response = await self.client.head(url)
+        response.raise_for_status()
+        return response.headers["ETag"]
+
+    async def get_etag(self, url: str) -> str:
+        """Получает ETag файла по url
+
+        :param url: url файла
+        :type url: str
+        :return: ETag файла
+        :rtype: str
+        """
+        return await self._retry(self._head, url)
+
+    @staticmethod
+    def _is_complete(response: httpx.Response, etag: str, size: int) -> bool:
+        """Проверяет по ответу 416, что недокачанный файл на самом деле
+        загружен полностью
+
+        :param response: Ответ 416 на запрос с Range
+        :type response: httpx.Response
+        :param etag: ETag недокачанного файла
+        :type etag: str
+        :param size: Размер недокачанного файла
+        :type size: int
+        :rtype: bool
+        """
+        if response.headers.get("ETag") != etag:
+            return False
+        # Content-Range: bytes */<размер файла>
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return not total.isdigit() or int(total) == size
+
+    async def _download(self, url: str, etag: str) -> tuple[Path, str]:
+        part = self.get_path(url, etag).with_suffix(".part")
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"Range": f"bytes={offset}-", "If-Range": etag}
+        async with self.client.stream(
+            "GET", url, headers=headers if offset else {}
+        ) as response:
+            if offset and response.status_code == 416:
+                # .part скачан целиком, но процесс завершился до
+                # переименования. Иначе .part не годится.
+                complete = self._is_complete(response, etag, offset)
+            else:
+                response.raise_for_status()
+                # 200 вместо 206: сервер не поддерживает Range или файл
+                # изменился, начинаем заново.
+                mode = "ab" if response.status_code == 206 else "wb"
+                etag = response.headers.get("ETag", etag)
+                if mode == "wb":
+                    part = self.get_path(url, etag).with_suffix(".part")
+                with open(part, mode) as file:
+                    async for data in response.aiter_bytes():
+                        file.write(data)
+                complete = True
+        if not complete:
+            part.unlink()
+            return await self._download(url, etag)
+        path = self.get_path(url, etag)
+        os.replace(part, path)
+        return path, etag
+
+    async def fetch(self, url: str, etag: str) -> tuple[Path, str]:
+        """Возвращает локальную копию файла, загружая её при отсутствии
+        в кэше
+
+        :param url: url файла
+        :type url: str
+        :param etag: ожидаемый ETag файла
+        :type etag: str
+        :return: путь к файлу и его ETag
+        :rtype: tuple[Path, str]
+        """
+        path = self.get_path(url, etag)
+        if path.exists():
+            return path, etag
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path, etag = await self._retry(self._download, url, etag)
+        # Прежние версии файла больше не нужны
+        url_prefix = path.name.split("-")[0]
+        for old in self.cache_dir.glob(f"{url_prefix}-*"):
+            if old != path:
+                old.unlink(missing_ok=True)
+        return path, etag
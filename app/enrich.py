@@ -0,0 +1,226 @@
+"""Обогащение файлов с номерами телефонов сведениями об операторе и
+регионе. Файл читается и пишется порциями, номера порции ищутся одним
+векторным проходом по отсортированным диапазонам индекса.
+"""
+import asyncio
+import io
+import os
+from pathlib import Path
+from typing import AsyncIterator
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .config import settings
+from .lookup import LookupIndex, lookup_index
+from .models import BLOCK_MP, PHONE_BLOCKS
+from .schemas import PHONE_REGEX
+from .service import Parse
+
+# Код страны в одиннадцатизначном номере
+PHONE_MP = 70000000000
+COLUMNS = ["phone", "found", "inn", "operator", "region", "sub_region"]
+
+# Индекс для обогащения, если API работает без in-memory индекса
+enrich_index = LookupIndex()
+
+
+class EnrichResponse(StreamingResponse):
+    """Потоковый ответ, который читает тело запроса по ходу ответа.
+    StreamingResponse параллельно ждёт отключения клиента и забирает
+    сообщения с телом запроса, поэтому ожидание здесь не запускается:
+    отключение обнаружится при чтении тела или отправке ответа.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def get_index(engine: AsyncEngine) -> LookupIndex:
+    """Возвращает индекс текущей версии реестра: индекс API, снимок
+    реестра или индекс, построенный по базе данных
+
+    :param engine: Асинхронный engine базы данных
+    :type engine: AsyncEngine
+    :return: Индекс номеров
+    :rtype: LookupIndex
+    """
+    if lookup_index.loaded:
+        return lookup_index
+    version = await asyncio.to_thread(Parse.get_redis_version)
+    if not enrich_index.loaded or enrich_index.version != version:
+        snapshot = Path(settings.registry_snapshot)
+        if snapshot.exists():
+            enrich_index.load_snapshot(snapshot)
+        if enrich_index.version != version:
+            await enrich_index.load(engine, version)
+    return enrich_index
+
+
+def quote(value) -> str:
+    """Записывает значение поля csv, при необходимости в кавычках"""
+    if value is None:
+        return ""
+    value = str(value)
+    if any(char in value for char in ';"\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def name_cells(names: list) -> list[str]:
+    """Готовит поля csv для каждой пары названий один раз на порцию
+
+    :param names: Пары (ИНН, оператор) или (регион, подрегион)
+    :type names: list
+    :return: Строки "поле;поле", последняя - пустая для ненайденных
+    :rtype: list[str]
+    """
+    return [f"{quote(a)};{quote(b)}" for a, b in names] + [";"]
+
+
+def enrich_chunk(index: LookupIndex, phones: pd.Series) -> str:
+    """Обогащает порцию номеров
+
+    :param index: Индекс номеров
+    :type index: LookupIndex
+    :param phones: Номера в том виде, в каком они записаны в файле
+    :type phones: pd.Series
+    :return: Строки csv в порядке входных номеров
+    :rtype: str
+    """
+    if pd.api.types.is_numeric_dtype(phones):
+        # Столбец из одних чисел: проверка без строковых операций
+        values = phones.to_numpy(np.float64)
+        valid = np.isfinite(values)
+        nums = np.zeros(len(phones), dtype=np.int64)
+        nums[valid] = values[valid].astype(np.int64) - PHONE_MP
+        valid &= (values == nums + PHONE_MP) & np.isin(
+            nums // BLOCK_MP, PHONE_BLOCKS
+        )
+        phones = list(map(str, (nums + PHONE_MP).tolist()))
+        for i in np.flatnonzero(~valid).tolist():
+            phones[i] = "" if np.isnan(values[i]) else f"{values[i]:.0f}"
+    else:
+        phones = phones.fillna("").str.strip(" \t+")
+        valid = phones.str.fullmatch(PHONE_REGEX).to_numpy(bool)
+        nums = np.zeros(len(phones), dtype=np.int64)
+        # Как в router.get_info: номер без начальной 7
+        nums[valid] = phones[valid].str.slice(1, 11).astype(np.int64)
+        phones = phones.tolist()
+        for i in np.flatnonzero(~valid).tolist():
+            phones[i] = quote(phones[i])
+    found, operator_rows, region_rows = index.find_positions(nums)
+    found &= valid
+    operators, regions = index.names
+    # Различных пар оператор-регион в порции немного: хвост строки
+    # собирается один раз на пару и приклеивается к номеру.
+    width = len(regions) + 1
+    pairs = np.where(found, operator_rows * width + region_rows, -1)
+    uniques, inverse = np.unique(pairs, return_inverse=True)
+    operator_cells = name_cells(operators)
+    region_cells = name_cells(regions)
+    tails = [
+        f";true;{operator_cells[pair // width]};"
+        f"{region_cells[pair % width]}\n"
+        if pair >= 0
+        else ";false;;;;\n"
+        for pair in uniques.tolist()
+    ]
+    # Номера и хвосты чередуются и склеиваются одним join: to_csv на
+    # порядок медленнее
+    parts = np.empty(2 * len(phones), dtype=object)
+    parts[::2] = phones
+    parts[1::2] = np.array(tails, dtype=object)[inverse]
+    return "".join(parts.tolist())
+
+
+def read_chunk(data: bytes) -> pd.Series:
+    """Разбирает порцию входного файла: номер - первое поле строки
+
+    :param data: Целые строки файла
+    :type data: bytes
+    :return: Номера
+    :rtype: pd.Series
+    """
+    return pd.read_csv(io.BytesIO(data), sep=";", header=None, usecols=[0])[0]
+
+
+def enrich_bytes(index: LookupIndex, data: bytes) -> str:
+    """Разбирает и обогащает порцию входного файла
+
+    :param index: Индекс номеров
+    :type index: LookupIndex
+    :param data: Целые строки файла
+    :type data: bytes
+    :return: Строки csv в порядке входных номеров
+    :rtype: str
+    """
+    return enrich_chunk(index, read_chunk(data))
+
+
+async def enrich_stream(
+    index: LookupIndex, body: AsyncIterator[bytes]
+) -> AsyncIterator[str]:
+    """Обогащает файл, поступающий частями, и отдаёт результат частями.
+    В памяти держится не больше порции входа и выхода.
+
+    :param index: Индекс номеров
+    :type index: LookupIndex
+    :param body: Части входного файла
+    :type body: AsyncIterator[bytes]
+    :return: Части обогащённого csv файла
+    :rtype: AsyncIterator[str]
+    """
+    yield ";".join(COLUMNS) + "\n"
+    parts, size = [], 0
+    async for data in body:
+        parts.append(data)
+        size += len(data)
+        if size < settings.enrich_chunk_bytes:
+            continue
+        buffer = b"".join(parts)
+        # Порция заканчивается на последней целой строке
+        cut = buffer.rfind(b"\n") + 1
+        if not cut:
+            parts = [buffer]
+            continue
+        parts, size = [buffer[cut:]], len(buffer) - cut
+        yield await asyncio.to_thread(enrich_bytes, index, buffer[:cut])
+    buffer = b"".join(parts)
+    if buffer.strip():
+        yield await asyncio.to_thread(enrich_bytes, index, buffer)
+
+
+def enrich_file(index: LookupIndex, source: Path, target: Path) -> int:
+    """Обогащает файл на диске. Результат появляется под именем target
+    только после записи целиком.
+
+    :param index: Индекс номеров
+    :type index: LookupIndex
+    :param source: Входной файл, номер - первое поле строки
+    :type source: Path
+    :param target: Файл результата
+    :type target: Path
+    :return: Число строк
+    :rtype: int
+    """
+    rows = 0
+    tmp = target.with_name(f"{target.name}.tmp")
+    with open(tmp, "w") as file:
+        file.write(";".join(COLUMNS) + "\n")
+        for chunk in pd.read_csv(
+            source,
+            sep=";",
+            header=None,
+            usecols=[0],
+            chunksize=settings.enrich_chunk_rows,
+        ):
+            file.write(enrich_chunk(index, chunk[0]))
+            rows += len(chunk)
+    os.replace(tmp, target)
+    return rows
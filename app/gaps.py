@@ -0,0 +1,159 @@
+"""Индекс незанятых интервалов номеров в блоках 3xx, 4xx, 8xx и 9xx.
+Номер из незанятого интервала заведомо не найдётся в реестре, поэтому на
+такой запрос можно ответить без обращения к базе данных.
+"""
+import asyncio
+import logging
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import crud
+from .models import BLOCK_MP, PHONE_BLOCKS
+from .service import Parse
+
+
+class GapIndex:
+    """Отсортированные полуинтервалы [начало, конец) номеров, не
+    покрытых ни одним диапазоном реестра.
+    """
+
+    def __init__(self) -> None:
+        """Метод конструктора"""
+        self.version = None
+        self._data = (np.empty(0, dtype=np.int64), np.empty(0, np.int64))
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+    def build(self, starts: np.ndarray, ends: np.ndarray) -> None:
+        """Строит дополнение диапазонов до блоков нумерации
+
+        :param starts: Начала диапазонов
+        :type starts: np.ndarray
+        :param ends: Концы диапазонов (не включительно)
+        :type ends: np.ndarray
+        """
+        order = np.argsort(starts, kind="stable")
+        starts, ends = starts[order], ends[order]
+        # Слияние пересекающихся и смежных диапазонов: новый отрезок
+        # начинается, если начало больше всех концов до него.
+        reach = np.maximum.accumulate(ends)
+        new = np.ones(len(starts), dtype=bool)
+        new[1:] = starts[1:] > reach[:-1]
+        first = np.flatnonzero(new)
+        covered_starts = starts[first]
+        covered_ends = (
+            np.maximum.reduceat(ends, first)
+            if len(first)
+            else np.empty(0, dtype=np.int64)
+        )
+        gap_starts, gap_ends = [], []
+        for block in PHONE_BLOCKS:
+            block_start, block_end = block * BLOCK_MP, (block + 1) * BLOCK_MP
+            inside = (covered_starts < block_end) & (
+                covered_ends > block_start
+            )
+            gap_starts.append(
+                np.append(block_start, covered_ends[inside]).clip(
+                    block_start, block_end
+                )
+            )
+            gap_ends.append(
+                np.append(covered_starts[inside], block_end).clip(
+                    block_start, block_end
+                )
+            )
+        gap_starts = np.concatenate(gap_starts)
+        gap_ends = np.concatenate(gap_ends)
+        empty = gap_starts >= gap_ends
+        self._data = (gap_starts[~empty], gap_ends[~empty])
+        self.loaded = True
+
+    async def load(self, engine: AsyncEngine, version: int = None) -> None:
+        """Строит индекс по таблице phone
+
+        :param engine: Асинхронный engine базы данных
+        :type engine: AsyncEngine
+        :param version: Версия реестра, по которой построен индекс
+        :type version: int, optional
+        """
+        async with engine.connect() as conn:
+            rows = await crud.get_ranges(conn)
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        self.build(rows[:, 0], rows[:, 1])
+        self.version = version
+
+    def contains(self, phone_num: int) -> bool:
+        """Проверяет, что номер не покрыт ни одним диапазоном
+
+        :param phone_num: Десятизначный номер телефона
+        :type phone_num: int
+        :return: Номер в незанятом интервале
+        :rtype: bool
+        """
+        gap_starts, gap_ends = self._data
+        i = int(np.searchsorted(gap_starts, phone_num, side="right")) - 1
+        return i >= 0 and phone_num < gap_ends[i]
+
+    def contains_many(self, phone_nums: list[int]) -> np.ndarray:
+        """Векторный contains для списка номеров
+
+        :param phone_nums: Десятизначные номера телефонов
+        :type phone_nums: list[int]
+        :return: Маска номеров в незанятых интервалах
+        :rtype: np.ndarray
+        """
+        gap_starts, gap_ends = self._data
+        nums = np.asarray(phone_nums, dtype=np.int64)
+        idx = np.searchsorted(gap_starts, nums, side="right") - 1
+        found = idx >= 0
+        found[found] = nums[found] < gap_ends[idx[found]]
+        return found
+
+    def gaps(self, start: int, end: int) -> list[tuple[int, int]]:
+        """Возвращает незанятые интервалы внутри [start, end)
+
+        :param start: Начало интервала номеров
+        :type start: int
+        :param end: Конец интервала номеров (не включительно)
+        :type end: int
+        :return: Полуинтервалы [начало, конец)
+        :rtype: list[tuple[int, int]]
+        """
+        gap_starts, gap_ends = self._data
+        first = np.searchsorted(gap_ends, start, side="right")
+        stop = np.searchsorted(gap_starts, end)
+        return list(
+            zip(
+                np.maximum(gap_starts[first:stop], start).tolist(),
+                np.minimum(gap_ends[first:stop], end).tolist(),
+            )
+        )
+
+    async def watch(self, engine: AsyncEngine, interval: float) -> None:
+        """Перестраивает индекс при изменении версии реестра в Redis
+
+        :param engine: Асинхронный engine базы данных
+        :type engine: AsyncEngine
+        :param interval: Период проверки версии, сек
+        :type interval: float
+        """
+        while True:
+            try:
+                version = await asyncio.to_thread(Parse.get_redis_version)
+                if version != self.version:
+                    await self.load(engine, version)
+                    logging.info(
+                        f"Индекс незанятых номеров перестроен, версия "
+                        f"{version}, интервалов {len(self)}"
+                    )
+            except Exception as err:
+                logging.warning(
+                    f"Ошибка обновления индекса незанятых номеров: {err}"
+                )
+            await asyncio.sleep(interval)
+
+
+gap_index = GapIndex()
@@ -0,0 +1,257 @@
+"""In-memory индекс диапазонов номеров. Позволяет искать оператора и
+регион по номеру без обращения к базе данных.
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import redis.asyncio as aioredis
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .models import Operator, Phone, Region
+from .service import Parse
+from .snapshot import read_snapshot, write_snapshot
+
+SNAPSHOT_LOCK_KEY = "registry_snapshot_lock"
+
+
+class LookupIndex:
+    """Отсортированные массивы начал и концов диапазонов с
+    интернированными названиями операторов и регионов.
+    """
+
+    def __init__(self) -> None:
+        """Метод конструктора"""
+        self.version = None
+        self._data = (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.int32),
+            [],
+            [],
+        )
+        self.loaded = False
+        self._snapshot_stat = None
+
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+    async def load(self, engine: AsyncEngine, version: int = None) -> None:
+        """Строит индекс по таблицам phone, operator и region
+
+        :param engine: Асинхронный engine базы данных
+        :type engine: AsyncEngine
+        :param version: Версия реестра, по которой построен индекс
+        :type version: int, optional
+        """
+        async with engine.connect() as conn:
+            operators = (
+                await conn.execute(
+                    select(Operator.id, Operator.inn, Operator.name)
+                )
+            ).all()
+            regions = (
+                await conn.execute(
+                    select(Region.id, Region.name, Region.sub_name)
+                )
+            ).all()
+            # Внутренние join, как в crud.get_info: диапазоны без
+            # оператора или региона не находятся и там.
+            phones = (
+                await conn.execute(
+                    select(
+                        func.lower(Phone.range),
+                        func.upper(Phone.range),
+                        Phone.operator_id,
+                        Phone.region_id,
+                    )
+                    .join(Operator)
+                    .join(Region)
+                )
+            ).all()
+        rows = np.array(phones, dtype=np.int64).reshape(-1, 4)
+        operator_ids = np.array([row[0] for row in operators], np.int64)
+        region_ids = np.array([row[0] for row in regions], np.int64)
+        operator_order = np.argsort(operator_ids)
+        region_order = np.argsort(region_ids)
+        starts = rows[:, 0]
+        ends = rows[:, 1]
+        # Позиция id в списках названий (id -> индекс строки)
+        operator_idx = operator_order[
+            np.searchsorted(operator_ids[operator_order], rows[:, 2])
+        ].astype(np.int32)
+        region_idx = region_order[
+            np.searchsorted(region_ids[region_order], rows[:, 3])
+        ].astype(np.int32)
+        order = np.argsort(starts, kind="stable")
+        # Замена одним присваиванием, чтобы поиск не увидел
+        # наполовину обновлённый индекс.
+        self._data = (
+            starts[order],
+            ends[order],
+            operator_idx[order],
+            region_idx[order],
+            [tuple(row[1:]) for row in operators],
+            [tuple(row[1:]) for row in regions],
+        )
+        self.version = version
+        self.loaded = True
+
+    def save(self, path: Path) -> None:
+        """Сохраняет индекс в двоичный снимок
+
+        :param path: Путь к файлу снимка
+        :type path: Path
+        """
+        write_snapshot(path, self.version, self._data)
+
+    def load_snapshot(self, path: Path) -> None:
+        """Загружает индекс из снимка, отображая его в память
+
+        :param path: Путь к файлу снимка
+        :type path: Path
+        """
+        stat = os.stat(path)
+        self.version, self._data = read_snapshot(path)
+        self._snapshot_stat = (stat.st_ino, stat.st_mtime_ns)
+        self.loaded = True
+
+    def find(self, phone_num: int):
+        """Ищет диапазон, содержащий номер
+
+        :param phone_num: Десятизначный номер телефона
+        :type phone_num: int
+        :return: (ИНН, оператор, регион, подрегион) или None
+        :rtype: tuple | None
+        """
+        starts, ends, operator_idx, region_idx, operators, regions = self._data
+        i = int(np.searchsorted(starts, phone_num, side="right")) - 1
+        # Границы int8range в базе хранятся как [lower, upper)
+        if i < 0 or phone_num >= ends[i]:
+            return None
+        return operators[operator_idx[i]] + regions[region_idx[i]]
+
+    def find_many(self, phone_nums: list[int]) -> list:
+        """Ищет диапазоны для списка номеров одним векторным поиском
+
+        :param phone_nums: Десятизначные номера телефонов
+        :type phone_nums: list[int]
+        :return: Результаты find в порядке входных номеров
+        :rtype: list
+        """
+        starts, ends, operator_idx, region_idx, operators, regions = self._data
+        nums = np.asarray(phone_nums, dtype=np.int64)
+        idx = np.searchsorted(starts, nums, side="right") - 1
+        found = idx >= 0
+        found[found] = nums[found] < ends[idx[found]]
+        return [
+            (operators[operator_idx[i]] + regions[region_idx[i]])
+            if hit
+            else None
+            for i, hit in zip(idx.tolist(), found.tolist())
+        ]
+
+    @property
+    def names(self) -> tuple[list, list]:
+        """Списки (ИНН, оператор) и (регион, подрегион), на которые
+        ссылаются позиции find_positions
+        """
+        return self._data[4], self._data[5]
+
+    def find_positions(self, phone_nums: np.ndarray) -> tuple:
+        """Ищет диапазоны для массива номеров. Номера сортируются перед
+        поиском, чтобы проход по массиву начал диапазонов шёл подряд.
+
+        :param phone_nums: Десятизначные номера телефонов, int64
+        :type phone_nums: np.ndarray
+        :return: Маска найденных номеров и позиции оператора и региона
+            в names, для ненайденных - длина списка
+        :rtype: tuple
+        """
+        starts, ends, operator_idx, region_idx, operators, regions = self._data
+        order = np.argsort(phone_nums, kind="stable")
+        idx = np.empty(len(phone_nums), dtype=np.int64)
+        idx[order] = (
+            np.searchsorted(starts, phone_nums[order], side="right") - 1
+        )
+        found = idx >= 0
+        found[found] = phone_nums[found] < ends[idx[found]]
+        operator_rows = np.full(len(idx), len(operators))
+        operator_rows[found] = operator_idx[idx[found]]
+        region_rows = np.full(len(idx), len(regions))
+        region_rows[found] = region_idx[idx[found]]
+        return found, operator_rows, region_rows
+
+    async def watch(self, engine: AsyncEngine, interval: float) -> None:
+        """Перестраивает индекс при изменении версии реестра в Redis
+
+        :param engine: Асинхронный engine базы данных
+        :type engine: AsyncEngine
+        :param interval: Период проверки версии, сек
+        :type interval: float
+        """
+        while True:
+            try:
+                version = await asyncio.to_thread(Parse.get_redis_version)
+                if version != self.version:
+                    await self.load(engine, version)
+                    logging.info(
+                        f"Индекс номеров перестроен, версия {version}, "
+                        f"диапазонов {len(self)}"
+                    )
+            except Exception as err:
+                logging.warning(f"Ошибка обновления индекса номеров: {err}")
+            await asyncio.sleep(interval)
+
+    async def watch_snapshot(self, path: Path, interval: float) -> None:
+        """Загружает снимок заново, когда его файл подменён
+
+        :param path: Путь к файлу снимка
+        :type path: Path
+        :param interval: Период проверки файла, сек
+        :type interval: float
+        """
+        while True:
+            try:
+                stat = os.stat(path)
+                if (stat.st_ino, stat.st_mtime_ns) != self._snapshot_stat:
+                    self.load_snapshot(path)
+                    logging.info(
+                        f"Снимок реестра загружен, версия {self.version}, "
+                        f"диапазонов {len(self)}"
+                    )
+            except FileNotFoundError:
+                pass
+            except Exception as err:
+                logging.warning(f"Ошибка загрузки снимка реестра: {err}")
+            await asyncio.sleep(interval)
+
+
+async def build_snapshot(engine: AsyncEngine, path: Path) -> int:
+    """Строит снимок реестра по базе данных. Снимки строятся по одному,
+    поэтому последний записанный снимок построен после последнего
+    импорта.
+
+    :param engine: Асинхронный engine базы данных
+    :type engine: AsyncEngine
+    :param path: Путь к файлу снимка
+    :type path: Path
+    :return: Версия реестра в снимке
+    :rtype: int
+    """
+    async with aioredis.StrictRedis(host=settings.redis_host) as r:
+        async with r.lock(SNAPSHOT_LOCK_KEY, timeout=600):
+            index = LookupIndex()
+            await index.load(
+                engine, await asyncio.to_thread(Parse.get_redis_version)
+            )
+            await asyncio.to_thread(index.save, path)
+    return index.version
+
+
+lookup_index = LookupIndex()
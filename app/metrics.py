@@ -0,0 +1,345 @@
+"""Метрики API и импорта в текстовом формате Prometheus. Метрики API
+считаются в памяти процесса, метрики импорта воркеры Celery сохраняют в
+Redis, и они читаются при каждом опросе /metrics.
+"""
+import bisect
+import functools
+import logging
+import time
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import settings
+
+IMPORT_METRICS_KEY = "import_metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Границы корзин гистограмм, сек
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+
+def format_labels(labels: dict) -> str:
+    """Записывает метки в формате Prometheus"""
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\""))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in escaped) + "}"
+
+
+class Counter:
+    """Счётчик с метками"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        """Метод конструктора
+
+        :param name: Имя метрики
+        :type name: str
+        :param help: Описание метрики
+        :type help: str
+        :param labels: Имена меток
+        :type labels: tuple, optional
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *values, amount: float = 1) -> None:
+        """Увеличивает счётчик
+
+        :param values: Значения меток в порядке self.labels
+        :param amount: Приращение, defaults to 1
+        :type amount: float, optional
+        """
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def samples(self):
+        for values, value in self._values.items():
+            yield self.name, dict(zip(self.labels, values)), value
+
+
+class Gauge(Counter):
+    """Значение, которое задаётся при каждом опросе"""
+
+    type = "gauge"
+
+    def set(self, value: float, *values) -> None:
+        """Задаёт значение
+
+        :param value: Значение
+        :type value: float
+        :param values: Значения меток в порядке self.labels
+        """
+        self._values[values] = value
+
+
+class Histogram(Counter):
+    """Гистограмма с метками и общими границами корзин"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple = (),
+        buckets: tuple = BUCKETS,
+    ) -> None:
+        """Метод конструктора
+
+        :param name: Имя метрики
+        :type name: str
+        :param help: Описание метрики
+        :type help: str
+        :param labels: Имена меток
+        :type labels: tuple, optional
+        :param buckets: Верхние границы корзин по возрастанию
+        :type buckets: tuple, optional
+        """
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *values) -> None:
+        """Добавляет наблюдение
+
+        :param value: Наблюдаемое значение
+        :type value: float
+        :param values: Значения меток в порядке self.labels
+        """
+        # Счётчики корзин без накопления, последняя - +Inf; сумма
+        # хранится в конце списка.
+        counts = self._values.get(values)
+        if counts is None:
+            counts = self._values[values] = [0] * (len(self.buckets) + 1)
+            counts.append(0.0)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for values, counts in self._values.items():
+            labels = dict(zip(self.labels, values))
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                yield f"{self.name}_bucket", {**labels, "le": bound}, total
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, total
+
+
+def render(metrics) -> str:
+    """Записывает метрики в текстовом формате Prometheus
+
+    :param metrics: Метрики
+    :type metrics: Iterable[Counter]
+    :return: Текст для ответа /metrics
+    :rtype: str
+    """
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "atrax_http_request_duration_seconds",
+    "Время обработки запроса",
+    ("method", "route", "status"),
+)
+DB_SECONDS = Histogram(
+    "atrax_db_query_duration_seconds",
+    "Время запроса поиска номеров в базу данных",
+    ("query",),
+)
+POOL_WAIT_SECONDS = Histogram(
+    "atrax_db_connection_acquire_seconds",
+    "Время получения соединения из пула engine API и реплик",
+)
+API_METRICS = [REQUEST_SECONDS, DB_SECONDS, POOL_WAIT_SECONDS]
+
+
+def timed(histogram: Histogram, *values):
+    """Декоратор корутины, который замеряет время её выполнения
+
+    :param histogram: Гистограмма для наблюдений
+    :type histogram: Histogram
+    :param values: Значения меток
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *values)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware, которое замеряет время запросов по шаблону пути
+    маршрута, методу и статусу ответа
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Метод конструктора
+
+        :param app: Приложение ASGI
+        :type app: ASGIApp
+        """
+        self.app = app
+        self._routes = None
+
+    def route(self, scope: Scope) -> str:
+        """Возвращает шаблон пути маршрута, обработавшего запрос"""
+        if self._routes is None:
+            self._routes = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        # Неизвестные пути идут одной меткой, чтобы их число не росло
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                self.route(scope),
+                status,
+            )
+
+
+async def read_import_metrics(redis: aioredis.Redis, urls: list) -> list:
+    """Читает из Redis метрики последнего импорта файлов реестра
+
+    :param redis: Клиент Redis
+    :type redis: aioredis.Redis
+    :param urls: url файлов реестра
+    :type urls: list
+    :return: Метрики импорта
+    :rtype: list[Gauge]
+    """
+    rows = Gauge(
+        "atrax_import_rows", "Строк в последнем импорте", ("file", "kind")
+    )
+    speed = Gauge(
+        "atrax_import_rows_per_second",
+        "Скорость последнего импорта",
+        ("file", "kind"),
+    )
+    duration = Gauge(
+        "atrax_import_duration_seconds",
+        "Длительность последнего импорта",
+        ("file",),
+    )
+    stages = Gauge(
+        "atrax_import_stage_seconds",
+        "Время стадий обработки порций в последнем импорте",
+        ("file", "stage"),
+    )
+    rejected = Gauge(
+        "atrax_import_rejected_rows",
+        "Строки, отброшенные проверкой в последнем импорте",
+        ("file", "reason"),
+    )
+    success = Gauge(
+        "atrax_import_last_success_timestamp_seconds",
+        "Время последнего успешного импорта",
+        ("file",),
+    )
+    pipe = redis.pipeline()
+    for url in urls:
+        pipe.hgetall(f"{IMPORT_METRICS_KEY}:{url}")
+    for url, values in zip(urls, await pipe.execute()):
+        elapsed = float(values.get("duration", 0))
+        if elapsed:
+            duration.set(elapsed, url)
+        for field, value in values.items():
+            kind, _, name = field.partition(":")
+            if kind == "rows":
+                rows.set(int(value), url, name)
+                if elapsed:
+                    speed.set(round(int(value) / elapsed, 1), url, name)
+            elif kind == "stage":
+                stages.set(float(value), url, name)
+            elif kind == "rejected":
+                rejected.set(int(value), url, name)
+            elif kind == "last_success":
+                success.set(float(value), url)
+    return [rows, speed, duration, stages, rejected, success]
+
+
+class MetricsEndpoint:
+    """Обработчик /metrics"""
+
+    def __init__(self, urls: list, extra=None) -> None:
+        """Метод конструктора
+
+        :param urls: url файлов реестра
+        :type urls: list
+        :param extra: Функция, возвращающая метрики, которые
+            собираются при опросе
+        :type extra: Callable[[], list[Counter]], optional
+        """
+        self.urls = urls
+        self.extra = extra
+        self.redis = aioredis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+        )
+
+    async def handle(self, request: Request) -> Response:
+        metrics = list(API_METRICS)
+        if self.extra:
+            metrics += self.extra()
+        try:
+            metrics += await read_import_metrics(self.redis, self.urls)
+        except RedisError as err:
+            # Метрики API отдаются и без Redis
+            logging.warning(f"Ошибка чтения метрик импорта: {err}")
+        return Response(render(metrics), media_type=CONTENT_TYPE)
@@ -1,9 +1,13 @@
 import sqlalchemy as sa
-from sqlalchemy.dialects.postgresql import INT8RANGE, ExcludeConstraint
+from sqlalchemy.dialects.postgresql import INT8RANGE
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
 
+# Блоки нумерации (первая цифра номера), по одному на файл реестра
+PHONE_BLOCKS = (3, 4, 8, 9)
+BLOCK_MP = 1000000000
+
 
 class Operator(Base):
     __tablename__ = "operator"
@@ -27,14 +31,55 @@ class Region(Base):
 
 class Phone(Base):
     __tablename__ = "phone"
-    id = sa.Column(sa.Integer, primary_key=True)
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    block = sa.Column(sa.SmallInteger, primary_key=True)
     range = sa.Column(INT8RANGE, nullable=False)
     operator_id = sa.Column(sa.BigInteger, sa.ForeignKey(Operator.id))
     region_id = sa.Column(sa.Integer, sa.ForeignKey(Region.id))
     operator = relationship("Operator", back_populates="phones")
     region = relationship("Region", back_populates="phones")
-    __table_args__ = (
-        ExcludeConstraint(
-            ("range", "&&"),
+    # Секции и их exclusion constraint создаются событием after_create
+    __table_args__ = {"postgresql_partition_by": "LIST (block)"}
+
+
+class DatasetVersion(Base):
+    """Версия загруженных данных блока нумерации. Меняется в транзакции
+    импорта, поэтому по ней видно, применила ли реплика импорт.
+    """
+
+    __tablename__ = "dataset_version"
+    block = sa.Column(sa.SmallInteger, primary_key=True, autoincrement=False)
+    version = sa.Column(sa.BigInteger, nullable=False, server_default="0")
+    updated_at = sa.Column(
+        sa.DateTime(timezone=True),
+        nullable=False,
+        server_default=sa.func.now(),
+    )
+
+
+# Индексы для постраничной выгрузки диапазонов по началу диапазона.
+# Создаются на секционированной таблице и наследуются секциями.
+RANGE_INDEXES = {
+    "lower": "lower(range)",
+    "operator_id_lower": "operator_id, lower(range)",
+    "region_id_lower": "region_id, lower(range)",
+}
+sa.Index("phone_lower_idx", sa.func.lower(Phone.range))
+sa.Index(
+    "phone_operator_id_lower_idx",
+    Phone.operator_id,
+    sa.func.lower(Phone.range),
+)
+sa.Index(
+    "phone_region_id_lower_idx", Phone.region_id, sa.func.lower(Phone.range)
+)
+
+for block in PHONE_BLOCKS:
+    sa.event.listen(
+        Phone.__table__,
+        "after_create",
+        sa.DDL(
+            f"CREATE TABLE phone_{block} PARTITION OF phone "
+            f"(EXCLUDE USING gist (range WITH &&)) FOR VALUES IN ({block})"
         ),
     )
@@ -0,0 +1,148 @@
+"""Потоковая выгрузка диапазонов реестра в NDJSON или CSV. Диапазоны
+читаются страницами по началу диапазона (keyset pagination), после каждой
+страницы соединение возвращается в пул, поэтому выгрузка не занимает его
+надолго и не мешает поиску номеров.
+"""
+import asyncio
+import json
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud
+from .config import settings
+from .enrich import quote
+
+COLUMNS = ["start", "end", "inn", "operator", "region", "sub_region"]
+
+# Одновременные выгрузки: пока все заняты, новые получают 429
+export_slots = asyncio.Semaphore(settings.ranges_max_streams)
+
+
+class ExportSlot:
+    """Слот выгрузки одного запроса. Освобождается и по окончании
+    потока, и фоновой задачей ответа, если поток не начался, поэтому
+    release можно вызывать повторно.
+    """
+
+    def __init__(self) -> None:
+        """Метод конструктора"""
+        self.held = False
+
+    async def acquire(self) -> bool:
+        """Занимает слот без ожидания
+
+        :return: Слот занят, False если свободных слотов нет
+        :rtype: bool
+        """
+        if export_slots.locked():
+            return False
+        # Свободный слот acquire занимает, не уступая цикл событий,
+        # поэтому между проверкой и захватом его не займёт другой запрос
+        await export_slots.acquire()
+        self.held = True
+        return True
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            export_slots.release()
+
+
+def prefix_bounds(prefix: str) -> tuple[int, int]:
+    """Возвращает первый и последний номер с префиксом
+
+    :param prefix: Начало одиннадцатизначного номера, "7916"
+    :type prefix: str
+    :return: Десятизначные номера (первый, последний)
+    :rtype: tuple[int, int]
+    """
+    digits = prefix[1:]
+    return int(digits.ljust(10, "0")), int(digits.ljust(10, "9"))
+
+
+def format_ndjson(rows: list) -> str:
+    """Записывает страницу диапазонов строками JSON"""
+    return "".join(
+        json.dumps(
+            dict(zip(COLUMNS, (f"7{lower}", f"7{upper}", *info))),
+            ensure_ascii=False,
+        )
+        + "\n"
+        for lower, upper, *info in rows
+    )
+
+
+def format_csv(rows: list) -> str:
+    """Записывает страницу диапазонов строками csv"""
+    return "".join(
+        f"7{lower};7{upper};{';'.join(map(quote, info))}\n"
+        for lower, upper, *info in rows
+    )
+
+
+async def stream_ranges(
+    session: AsyncSession,
+    prefix: str = None,
+    inn: int = None,
+    region: str = None,
+    after: str = None,
+    output_format: str = "ndjson",
+    slot: ExportSlot = None,
+) -> AsyncIterator[str]:
+    """Выгружает диапазоны в порядке начала диапазона
+
+    :param session: Сессия базы данных
+    :type session: AsyncSession
+    :param prefix: Префикс номера, диапазоны которого выгружаются
+    :type prefix: str, optional
+    :param inn: ИНН оператора
+    :type inn: int, optional
+    :param region: Регион
+    :type region: str, optional
+    :param after: Начало последнего полученного диапазона: выгрузка
+        продолжится со следующего
+    :type after: str, optional
+    :param output_format: "ndjson" или "csv"
+    :type output_format: str, optional
+    :param slot: Занятый слот выгрузки, освобождается по окончании
+    :type slot: ExportSlot, optional
+    :return: Части выгрузки
+    :rtype: AsyncIterator[str]
+    """
+    try:
+        formatter = format_ndjson
+        if output_format == "csv":
+            formatter = format_csv
+            yield ";".join(COLUMNS) + "\n"
+        cursor, upper = -1, None
+        operator_ids = region_ids = None
+        if prefix:
+            first, upper = prefix_bounds(prefix)
+            # Диапазон, начатый до префикса, тоже входит в выгрузку
+            start = await crud.get_range_start(session, first)
+            cursor = (first if start is None else start) - 1
+        if inn is not None:
+            operator_ids = await crud.get_operator_ids_by_inn(session, inn)
+        if region is not None:
+            region_ids = await crud.get_region_ids_by_name(session, region)
+        if after:
+            cursor = max(cursor, int(after[1:]))
+        while True:
+            rows = await crud.get_range_page(
+                session,
+                cursor,
+                settings.ranges_page_size,
+                upper,
+                operator_ids,
+                region_ids,
+            )
+            await session.close()
+            if rows:
+                yield formatter(rows)
+            if len(rows) < settings.ranges_page_size:
+                break
+            cursor = rows[-1][0]
+    finally:
+        if slot is not None:
+            slot.release()
@@ -0,0 +1,184 @@
+"""Распределение сессий поиска номеров по репликам для чтения. Сессия
+уходит на реплику, только если реплика отвечает и уже применила
+последний зафиксированный импорт каждого блока нумерации, иначе - в
+основную базу. Импорт всегда пишет в основную базу.
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+
+from redis.exceptions import RedisError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from . import crud
+from .config import settings
+from .database import async_session, create_replica_engine
+from .metrics import Counter, Gauge
+from .versions import RegistryVersions, registry_versions
+
+
+class Replica:
+    """Реплика для чтения и её состояние по последней проверке"""
+
+    def __init__(self, url: str) -> None:
+        """Метод конструктора
+
+        :param url: DSN реплики
+        :type url: str
+        """
+        url = make_url(url)
+        self.name = f"{url.host}:{url.port or 5432}/{url.database}"
+        self.engine = create_replica_engine(url)
+        self.sessions = sessionmaker(
+            self.engine, expire_on_commit=False, class_=AsyncSession
+        )
+        # None - реплика ещё не проверялась
+        self.healthy = None
+        # Блок нумерации -> версия данных, применённая репликой
+        self.versions = {}
+
+    def is_current(self, required: dict) -> bool:
+        """Применила ли реплика импорты с требуемыми версиями
+
+        :param required: Блок нумерации -> версия данных
+        :type required: dict
+        :rtype: bool
+        """
+        return bool(self.healthy) and all(
+            self.versions.get(block, 0) >= version
+            for block, version in required.items()
+        )
+
+
+class ReplicaRouter:
+    """Выбирает фабрику сессий для поиска: по кругу среди актуальных
+    реплик или основную базу
+    """
+
+    def __init__(
+        self,
+        urls: list,
+        primary: sessionmaker = async_session,
+        versions: RegistryVersions = registry_versions,
+    ) -> None:
+        """Метод конструктора
+
+        :param urls: DSN реплик
+        :type urls: list
+        :param primary: Фабрика сессий основной базы,
+            defaults to async_session
+        :type primary: sessionmaker, optional
+        :param versions: Версии блоков последнего импорта,
+            defaults to registry_versions
+        :type versions: RegistryVersions, optional
+        """
+        self.primary = primary
+        self.versions = versions
+        self.replicas = [Replica(url) for url in urls]
+        self._order = itertools.cycle(range(len(self.replicas) or 1))
+        self.sessions = {}
+
+    @staticmethod
+    async def read_versions(replica: Replica) -> dict:
+        """Читает версии данных, применённые репликой
+
+        :param replica: Реплика
+        :type replica: Replica
+        :return: Блок нумерации -> версия данных
+        :rtype: dict
+        """
+        async with replica.engine.connect() as conn:
+            return await crud.get_dataset_versions(conn)
+
+    async def check_replica(self, replica: Replica) -> None:
+        """Проверяет реплику и читает применённые версии данных"""
+        try:
+            # Таймаут общий на подключение и запрос: недоступная по сети
+            # реплика иначе держит проверку до таймаута TCP
+            replica.versions = await asyncio.wait_for(
+                self.read_versions(replica), settings.db_replica_check_timeout
+            )
+        except Exception as err:
+            if replica.healthy is not False:
+                logging.warning(f"Реплика {replica.name} недоступна: {err}")
+            replica.healthy = False
+        else:
+            if not replica.healthy:
+                logging.info(f"Реплика {replica.name} доступна")
+            replica.healthy = True
+
+    async def check(self) -> None:
+        """Проверяет все реплики"""
+        await asyncio.gather(*map(self.check_replica, self.replicas))
+
+    async def watch(self, interval: float) -> None:
+        """Проверяет реплики раз в interval секунд
+
+        :param interval: Период проверки, сек
+        :type interval: float
+        """
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    async def choose(self) -> tuple:
+        """Выбирает, куда направить сессию поиска
+
+        :return: Имя цели и её фабрика сессий
+        :rtype: tuple[str, sessionmaker]
+        """
+        if not self.replicas:
+            return "primary", self.primary
+        try:
+            required = await self.versions.get()
+        except RedisError as err:
+            # Без версий импорта нельзя проверить отставание реплик
+            logging.warning(f"Ошибка чтения версий реестра: {err}")
+            return "primary", self.primary
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._order)]
+            if replica.is_current(required):
+                return replica.name, replica.sessions
+        return "primary", self.primary
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """Сессия только для чтения на реплике или в основной базе"""
+        name, factory = await self.choose()
+        self.sessions[name] = self.sessions.get(name, 0) + 1
+        async with factory() as session:
+            yield session
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def metrics(self) -> list:
+        """Возвращает метрики распределения сессий для /metrics
+
+        :return: Сессии по целям и состояние реплик
+        :rtype: list[Counter]
+        """
+        sessions = Counter(
+            "atrax_db_read_sessions_total",
+            "Сессии поиска по базам, в которые они направлены",
+            ("target",),
+        )
+        for name, count in self.sessions.items():
+            sessions.inc(name, amount=count)
+        healthy = Gauge(
+            "atrax_db_replica_healthy",
+            "Реплика отвечала при последней проверке",
+            ("replica",),
+        )
+        for replica in self.replicas:
+            healthy.set(int(bool(replica.healthy)), replica.name)
+        return [sessions, healthy]
+
+
+replica_router = ReplicaRouter(
+    [url.strip() for url in settings.db_replica_urls.split(",") if url.strip()]
+)
@@ -1,32 +1,278 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, status
+import asyncio
+import logging
+import uuid
+from pathlib import Path as FilePath
+
+import numpy as np
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
 
 from . import crud
-from .dependencies import get_session
-from .schemas import PhoneInfo
-from .service import Parse
-from .tasks import celery_parse, celery_parse_all_csv
+from .cache import lookup_cache
+from .coalescer import lookup_coalescer
+from .config import settings
+from .database import engine
+from .dependencies import get_redis_db, get_session
+from .enrich import EnrichResponse, enrich_stream, get_index
+from .gaps import GapIndex, gap_index
+from .lookup import lookup_index
+from .models import BLOCK_MP
+from .ranges import ExportSlot, stream_ranges
+from .schemas import (
+    PHONE_REGEX,
+    PREFIX_REGEX,
+    RANGE_PREFIX_REGEX,
+    BatchItem,
+    BatchRequest,
+    Gap,
+    ImportStatus,
+    ImportTask,
+    PhoneInfo,
+)
+from .service import PREFIX_MP, Parse
+from .tasks import celery_enrich, queue_parse
+from .versions import registry_versions
 
 router = APIRouter(prefix="/api", tags=["api"])
 
 
+def to_phone_info(result) -> PhoneInfo:
+    return PhoneInfo(
+        inn=result[0],
+        operator=result[1],
+        region=result[2],
+        sub_region=result[3],
+    )
+
+
+async def find_info(session: AsyncSession, phone_num: int):
+    if settings.lookup_backend != "sql" and lookup_index.loaded:
+        return lookup_index.find(phone_num)
+    if gap_index.loaded and gap_index.contains(phone_num):
+        return None
+    if settings.lookup_cache:
+        return await lookup_cache.get_info(session, phone_num)
+    if settings.lookup_coalesce:
+        return await lookup_coalescer.get_info(phone_num)
+    return await crud.get_info(session, phone_num)
+
+
+async def registry_etag(phone_num: int):
+    # Ответ меняется только с импортом файла блока номера. Индекс в
+    # памяти строится по общей версии реестра, она и идёт в ETag.
+    if settings.lookup_backend != "sql" and lookup_index.loaded:
+        return f'"{lookup_index.version}"'
+    try:
+        versions = await registry_versions.get()
+    except RedisError as err:
+        logging.warning(f"Ошибка чтения версий реестра: {err}")
+        return None
+    block = phone_num // BLOCK_MP
+    return f'"{block}.{versions.get(block, 0)}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return await lookup_cache.stats()
+
+
+@router.post("/batch", response_model=list[BatchItem])
+async def get_info_batch(
+    batch: BatchRequest,
+    session: AsyncSession = Depends(get_session),
+):
+    phone_nums = [int(phone_num[1:11]) for phone_num in batch.numbers]
+    if settings.lookup_backend != "sql" and lookup_index.loaded:
+        results = lookup_index.find_many(phone_nums)
+    elif gap_index.loaded:
+        # В базу уходят только номера вне незанятых интервалов
+        in_gap = gap_index.contains_many(phone_nums).tolist()
+        found = iter(
+            await crud.get_info_batch(
+                session,
+                [num for num, gap in zip(phone_nums, in_gap) if not gap],
+            )
+        )
+        results = [None if gap else next(found) for gap in in_gap]
+    else:
+        results = await crud.get_info_batch(session, phone_nums)
+    return [
+        BatchItem(
+            phone_num=phone_num,
+            found=result is not None,
+            info=to_phone_info(result) if result else None,
+        )
+        for phone_num, result in zip(batch.numbers, results)
+    ]
+
+
+@router.post("/enrich")
+async def enrich(request: Request):
+    index = await get_index(engine)
+    return EnrichResponse(
+        enrich_stream(index, request.stream()), media_type="text/csv"
+    )
+
+
+@router.post("/enrich/tasks", status_code=status.HTTP_202_ACCEPTED)
+async def enrich_task(request: Request):
+    task_id = uuid.uuid4().hex
+    enrich_dir = FilePath(settings.enrich_dir)
+    enrich_dir.mkdir(parents=True, exist_ok=True)
+    source = enrich_dir / f"{task_id}.in.csv"
+    # Запись на диск в потоке, чтобы не задерживать поиски номеров
+    file = await asyncio.to_thread(open, source, "wb")
+    try:
+        async for data in request.stream():
+            await asyncio.to_thread(file.write, data)
+    finally:
+        await asyncio.to_thread(file.close)
+    celery_enrich.apply_async(
+        (str(source), str(enrich_dir / f"{task_id}.csv")), task_id=task_id
+    )
+    return {"task_id": task_id}
+
+
+@router.get("/enrich/tasks/{task_id}")
+async def enrich_result(task_id: str = Path(..., regex=r"^[0-9a-f]{32}$")):
+    target = FilePath(settings.enrich_dir) / f"{task_id}.csv"
+    if target.exists():
+        return FileResponse(target, media_type="text/csv")
+    if not (FilePath(settings.enrich_dir) / f"{task_id}.in.csv").exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Задача не найдена.",
+        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"message": "Enrichment in progress"},
+    )
+
+
+@router.get("/ranges")
+async def get_ranges(
+    prefix: str = Query(None, regex=RANGE_PREFIX_REGEX),
+    inn: int = None,
+    region: str = None,
+    after: str = Query(None, regex=PHONE_REGEX),
+    output_format: str = Query(
+        "ndjson", alias="format", regex="^(ndjson|csv)$"
+    ),
+    session: AsyncSession = Depends(get_session),
+):
+    slot = ExportSlot()
+    if not await slot.acquire():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много одновременных выгрузок.",
+        )
+    return StreamingResponse(
+        stream_ranges(
+            session, prefix, inn, region, after, output_format, slot
+        ),
+        media_type=(
+            "text/csv" if output_format == "csv" else "application/x-ndjson"
+        ),
+        background=BackgroundTask(slot.release),
+    )
+
+
+@router.get("/gaps/{prefix}", response_model=list[Gap])
+async def get_gaps(
+    prefix: str = Path(..., regex=PREFIX_REGEX),
+    session: AsyncSession = Depends(get_session),
+):
+    start = int(prefix) * PREFIX_MP
+    end = start + PREFIX_MP
+    index = gap_index
+    if not index.loaded:
+        rows = await crud.get_ranges(session, start, end)
+        index = GapIndex()
+        index.build(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=np.int64),
+        )
+    return [
+        Gap(start=f"7{lower}", end=f"7{upper - 1}", size=upper - lower)
+        for lower, upper in index.gaps(start, end)
+    ]
+
+
 @router.get("/{phone_num}", response_model=PhoneInfo)
 async def get_info(
-    phone_num: str = Path(..., regex=r"^7[3489]\d{9}$"),
+    request: Request,
+    response: Response,
+    phone_num: str = Path(..., regex=PHONE_REGEX),
     session: AsyncSession = Depends(get_session),
 ):
-    result = await crud.get_info(session, int(phone_num[1:11]))
+    num = int(phone_num[1:11])
+    headers = {}
+    etag = await registry_etag(num)
+    if etag:
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={settings.http_cache_max_age}",
+        }
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+            )
+    result = await find_info(session, num)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="К сожалению, номер не найден.",
+            headers=headers or None,
         )
-    return PhoneInfo(
-        inn=result[0],
-        operator=result[1],
-        region=result[2],
-        sub_region=result[3],
-    )
+    response.headers.update(headers)
+    return to_phone_info(result)
+
+
+def to_import_status(values: dict) -> ImportStatus:
+    stages = {
+        field.split(":", 1)[1]: value
+        for field, value in values.items()
+        if field.startswith("stage:")
+    }
+    return ImportStatus(**values, stages=stages)
+
+
+@router.get("/parse/status", response_model=list[ImportStatus])
+async def parse_statuses(
+    limit: int = Query(50, ge=1, le=1000), db: int = Depends(get_redis_db)
+):
+    statuses = await asyncio.to_thread(Parse.list_redis_statuses, limit, db)
+    return [to_import_status(values) for values in statuses]
+
+
+@router.get("/parse/status/{task_id}", response_model=ImportStatus)
+async def parse_status(task_id: str, db: int = Depends(get_redis_db)):
+    values = await asyncio.to_thread(Parse.get_redis_status, task_id, db)
+    if not values:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Задача не найдена.",
+        )
+    return to_import_status(values)
 
 
 @router.get("/parse/{file_num}", status_code=status.HTTP_202_ACCEPTED)
@@ -34,11 +280,31 @@ async def parse(
     file_num: int = Path(..., ge=0, lt=len(Parse.REMOTE_URLS)),
     is_filtered: bool = False,
 ):
-    celery_parse.delay(Parse.REMOTE_URLS[file_num], is_filtered)
-    return {"message": "Parse queued"}
+    file_name = Parse.REMOTE_URLS[file_num]
+    task_id = await asyncio.to_thread(queue_parse, file_name, is_filtered)
+    if task_id is None:
+        running = await asyncio.to_thread(Parse.get_import_lock, file_name)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Файл уже загружается задачей {running}.",
+        )
+    return {"message": "Parse queued", "task_id": task_id}
 
 
-@router.get("/parse_all/{is_fitered}", status_code=status.HTTP_202_ACCEPTED)
+@router.get(
+    "/parse_all/{is_fitered}",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=list[ImportTask],
+)
 async def parse_all(is_filtered: bool = False):
-    celery_parse_all_csv.delay(is_filtered)
-    return {"message": "Parse all queued"}
+    tasks = []
+    for file_name in Parse.REMOTE_URLS:
+        task_id = await asyncio.to_thread(queue_parse, file_name, is_filtered)
+        queued = task_id is not None
+        if not queued:
+            # Файл уже загружается: отдаётся id идущей задачи
+            task_id = await asyncio.to_thread(Parse.get_import_lock, file_name)
+        tasks.append(
+            ImportTask(file=file_name, task_id=task_id, queued=queued)
+        )
+    return tasks
@@ -1,4 +1,11 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, conlist, constr
+
+PHONE_REGEX = r"^7[3489]\d{9}$"
+PREFIX_REGEX = r"^[3489]\d{2}$"
+RANGE_PREFIX_REGEX = r"^7[3489]\d{0,9}$"
+BATCH_MAX_ITEMS = 10000
 
 
 class PhoneInfo(BaseModel):
@@ -6,3 +13,44 @@ class PhoneInfo(BaseModel):
     operator: str
     region: str
     sub_region: str
+
+
+class BatchRequest(BaseModel):
+    numbers: conlist(
+        constr(regex=PHONE_REGEX), min_items=1, max_items=BATCH_MAX_ITEMS
+    )
+
+
+class BatchItem(BaseModel):
+    phone_num: str
+    found: bool
+    info: Optional[PhoneInfo] = None
+
+
+class Gap(BaseModel):
+    start: str
+    end: str
+    size: int
+
+
+class ImportStatus(BaseModel):
+    task_id: str
+    file: Optional[str] = None
+    etag: Optional[str] = None
+    state: str
+    chunks: int = 0
+    rows: int = 0
+    rows_per_second: float = 0.0
+    stages: dict[str, float] = {}
+    changed: Optional[bool] = None
+    error: Optional[str] = None
+    retries: int = 0
+    queued_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class ImportTask(BaseModel):
+    file: str
+    task_id: Optional[str]
+    queued: bool
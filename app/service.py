@@ -1,22 +1,34 @@
 """Реализация класса Parse,который парсит и загружает в базу данных
 csv файл в формате Реестра российской системы и плана нумерации.
 """
+import asyncio
+import contextlib
 import logging
-import ssl
+import os
+import time
+from pathlib import Path
 
 import httpx
 import numpy as np
 import pandas as pd
 import redis
-from sqlalchemy.dialects.postgresql import Range
 from sqlalchemy.exc import DBAPIError
-from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
 from . import crud
 from .config import settings
+from .dimensions import DimensionCache
+from .download import Downloader
+from .metrics import IMPORT_METRICS_KEY
+from .models import BLOCK_MP, PHONE_BLOCKS, Phone
+from .validation import RangeValidator
 
-CHUNK_SIZE = 1000
 PREFIX_MP = 10000000  # multiplier
+REGISTRY_VERSION_KEY = "registry_version"
+CHECKPOINT_KEY = "import_checkpoint"
+IMPORT_STATUS_KEY = "import_status"
+IMPORT_TASKS_KEY = "import_tasks"
+IMPORT_LOCK_KEY = "import_lock"
 
 logging.basicConfig(level=logging.INFO)
 
@@ -32,15 +44,39 @@ class Parse:
         "https://opendata.digital.gov.ru/downloads/ABC-8xx.csv",
         "https://opendata.digital.gov.ru/downloads/DEF-9xx.csv",
     ]
+    BLOCKS = list(PHONE_BLOCKS)
 
-    def __init__(self, engine: AsyncEngine) -> None:
+    def __init__(
+        self, engine: AsyncEngine, task_id: str = None, db: int = 0
+    ) -> None:
         """Метод конструктора
 
         :param engine: Асинхронный engine базы данных
         :type engine: AsyncEngine
+        :param task_id: id задачи Celery, под которым публикуется статус
+            импорта, defaults to None
+        :type task_id: str, optional
+        :param db: Номер базы в Redis для ETag, версий, метрик и
+            статуса импорта, defaults to 0
+        :type db: int, optional
         """
         self.engine = engine
+        self.task_id = task_id
+        self.db = db
         self.conn = None
+        self.table = Phone.__table__
+        self.dimensions = DimensionCache()
+        self.validator = RangeValidator()
+        self.rows = 0
+        self.parsed = 0
+        self.inserted = 0
+        self.conflicts = 0
+        self.chunks = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self.timings = {}
+        self.checkpoint = None
+        self.done = {}
 
     @staticmethod
     def get_file_etag(url: str) -> str:
@@ -92,6 +128,390 @@ class Parse:
         )
         r.set(url, etag)
 
+    @staticmethod
+    def get_redis_version(db: int = 0, block: int = None) -> int:
+        """Получает версию загруженного реестра, сохранённую в Redis
+
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :param block: Блок нумерации, если нужна версия блока,
+            defaults to None
+        :type block: int, optional
+        :return: Версия реестра, 0 если реестр ещё не загружался
+        :rtype: int
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        if block is not None:
+            return int(r.get(f"{REGISTRY_VERSION_KEY}:{block}") or 0)
+        return int(r.get(REGISTRY_VERSION_KEY) or 0)
+
+    @staticmethod
+    def bump_redis_version(
+        block: int = None, db: int = 0, version: int = None
+    ) -> int:
+        """Увеличивает версию загруженного реестра в Redis, а также
+        версию блока нумерации, если он указан.
+
+        :param block: Блок нумерации (3, 4, 8 или 9), defaults to None
+        :type block: int, optional
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :param version: Версия данных блока из dataset_version, вместо
+            увеличения на единицу, defaults to None
+        :type version: int, optional
+        :return: Новая версия реестра
+        :rtype: int
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        pipe = r.pipeline()
+        pipe.incr(REGISTRY_VERSION_KEY)
+        if version is not None:
+            pipe.set(f"{REGISTRY_VERSION_KEY}:{block}", version)
+        elif block is not None:
+            pipe.incr(f"{REGISTRY_VERSION_KEY}:{block}")
+        return pipe.execute()[0]
+
+    @classmethod
+    def get_file_block(cls, file_name: str) -> int:
+        """Возвращает блок нумерации файла
+
+        :param file_name: имя или url файла
+        :type file_name: str
+        :return: Блок нумерации (3, 4, 8 или 9)
+        :rtype: int
+        """
+        return dict(zip(cls.REMOTE_URLS, cls.BLOCKS))[file_name]
+
+    @staticmethod
+    def set_redis_diff(url: str, counts: dict, db: int = 0) -> None:
+        """Сохраняет в Redis число вставленных, удалённых и изменённых
+        диапазонов последнего инкрементального импорта файла
+
+        :param url: url файла
+        :type url: str
+        :param counts: Счётчики изменений
+        :type counts: dict
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        r.hset(f"import_diff:{url}", mapping=counts)
+
+    @staticmethod
+    def set_redis_metrics(url: str, values: dict, db: int = 0) -> None:
+        """Заменяет в Redis метрики последнего импорта файла
+
+        :param url: url файла
+        :type url: str
+        :param values: Поля метрик
+        :type values: dict
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        pipe = r.pipeline()
+        pipe.delete(f"{IMPORT_METRICS_KEY}:{url}")
+        pipe.hset(f"{IMPORT_METRICS_KEY}:{url}", mapping=values)
+        pipe.execute()
+
+    def get_metrics(self) -> dict:
+        """Собирает метрики импорта для /metrics
+
+        :return: Строки, длительность, время стадий, отброшенные строки
+            и время успешного импорта
+        :rtype: dict
+        """
+        return {
+            "rows:parsed": self.parsed,
+            "rows:inserted": self.inserted,
+            "duration": round(self.elapsed, 3),
+            **{
+                f"stage:{stage}": round(seconds, 3)
+                for stage, seconds in self.timings.items()
+            },
+            **{
+                f"rejected:{reason}": count
+                for reason, count in self.validator.counts.items()
+            },
+            # Строки, которые база отбросила по ON CONFLICT DO NOTHING
+            "rejected:conflict": self.conflicts,
+            "last_success": time.time(),
+        }
+
+    @staticmethod
+    def set_redis_status(task_id: str, values: dict, db: int = 0) -> None:
+        """Дополняет в Redis статус задачи импорта и добавляет задачу в
+        список задач
+
+        :param task_id: id задачи Celery
+        :type task_id: str
+        :param values: Поля статуса
+        :type values: dict
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        key = f"{IMPORT_STATUS_KEY}:{task_id}"
+        now = time.time()
+        pipe = r.pipeline()
+        pipe.hset(key, mapping={"task_id": task_id, **values})
+        pipe.expire(key, settings.import_status_ttl)
+        pipe.zadd(IMPORT_TASKS_KEY, {task_id: now}, nx=True)
+        pipe.zremrangebyscore(
+            IMPORT_TASKS_KEY, 0, now - settings.import_status_ttl
+        )
+        pipe.execute()
+
+    @staticmethod
+    def get_redis_status(task_id: str, db: int = 0) -> dict:
+        """Получает из Redis статус задачи импорта
+
+        :param task_id: id задачи Celery
+        :type task_id: str
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :return: Поля статуса, пустой словарь для неизвестной задачи
+        :rtype: dict
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        return r.hgetall(f"{IMPORT_STATUS_KEY}:{task_id}")
+
+    @staticmethod
+    def list_redis_statuses(limit: int, db: int = 0) -> list[dict]:
+        """Получает из Redis статусы последних задач импорта
+
+        :param limit: Наибольшее число задач
+        :type limit: int
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :return: Статусы, начиная с последней поставленной задачи
+        :rtype: list[dict]
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        task_ids = r.zrevrange(IMPORT_TASKS_KEY, 0, limit - 1)
+        pipe = r.pipeline()
+        for task_id in task_ids:
+            pipe.hgetall(f"{IMPORT_STATUS_KEY}:{task_id}")
+        return [status for status in pipe.execute() if status]
+
+    @staticmethod
+    def acquire_import_lock(url: str, task_id: str, db: int = 0) -> bool:
+        """Закрепляет импорт файла за задачей. Повтор той же задачи
+        блокировку сохраняет.
+
+        :param url: url файла
+        :type url: str
+        :param task_id: id задачи Celery
+        :type task_id: str
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :return: Файл закреплён за задачей
+        :rtype: bool
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        key = f"{IMPORT_LOCK_KEY}:{url}"
+        if r.set(key, task_id, nx=True, ex=settings.import_lock_ttl):
+            return True
+        if r.get(key) == task_id:
+            r.expire(key, settings.import_lock_ttl)
+            return True
+        return False
+
+    @staticmethod
+    def get_import_lock(url: str, db: int = 0) -> str:
+        """Возвращает id задачи, которая импортирует файл
+
+        :param url: url файла
+        :type url: str
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :return: id задачи или None
+        :rtype: str
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        return r.get(f"{IMPORT_LOCK_KEY}:{url}")
+
+    @staticmethod
+    def release_import_lock(url: str, task_id: str, db: int = 0) -> None:
+        """Снимает блокировку импорта файла, если она принадлежит задаче
+
+        :param url: url файла
+        :type url: str
+        :param task_id: id задачи Celery
+        :type task_id: str
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        key = f"{IMPORT_LOCK_KEY}:{url}"
+        with r.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) == task_id:
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+            except redis.WatchError:
+                # Блокировку успела взять другая задача
+                pass
+
+    def publish_status(self, values: dict) -> None:
+        """Публикует статус импорта, если задан id задачи
+
+        :param values: Поля статуса
+        :type values: dict
+        """
+        if self.task_id:
+            self.set_redis_status(self.task_id, values, self.db)
+
+    def get_progress(self) -> dict:
+        """Собирает прогресс импорта для статуса задачи
+
+        :return: Порции и строки, скорость и время стадий
+        :rtype: dict
+        """
+        elapsed = time.perf_counter() - self.started
+        return {
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "rows_per_second": round(self.rows / elapsed, 1),
+            **{
+                f"stage:{stage}": round(seconds, 3)
+                for stage, seconds in self.timings.items()
+            },
+        }
+
+    @staticmethod
+    def get_redis_checkpoint(url: str, db: int = 0) -> dict:
+        """Получает из Redis прогресс импорта файла: ETag, размер порции
+        и число строк в каждой зафиксированной порции
+
+        :param url: url файла
+        :type url: str
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :return: Поля etag, chunk_size и chunk:<номер порции>
+        :rtype: dict
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        return r.hgetall(f"{CHECKPOINT_KEY}:{url}")
+
+    @staticmethod
+    def set_redis_checkpoint(url: str, values: dict, db: int = 0) -> None:
+        """Дополняет в Redis прогресс импорта файла
+
+        :param url: url файла
+        :type url: str
+        :param values: Поля для сохранения
+        :type values: dict
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        r.hset(f"{CHECKPOINT_KEY}:{url}", mapping=values)
+
+    @staticmethod
+    def delete_redis_checkpoint(url: str, db: int = 0) -> None:
+        """Удаляет из Redis прогресс импорта файла
+
+        :param url: url файла
+        :type url: str
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        r = redis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        r.delete(f"{CHECKPOINT_KEY}:{url}")
+
+    @classmethod
+    def get_done_chunks(cls, url: str, etag: str, db: int = 0) -> dict:
+        """Возвращает зафиксированные порции прерванного импорта той же
+        версии файла
+
+        :param url: url файла
+        :type url: str
+        :param etag: ETag загружаемого файла
+        :type etag: str
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        :return: Номер порции -> число строк, None если продолжать нечего
+        :rtype: dict | None
+        """
+        checkpoint = cls.get_redis_checkpoint(url, db)
+        if checkpoint.get("etag") != etag or checkpoint.get(
+            "chunk_size"
+        ) != str(settings.import_chunk_size):
+            return None
+        return {
+            int(key.split(":")[1]): int(rows)
+            for key, rows in checkpoint.items()
+            if key.startswith("chunk:")
+        }
+
     @staticmethod
     def clear_redis(db: int = 0) -> None:
         """Чистит ключи url в Redis.
@@ -108,74 +528,81 @@ class Parse:
         for url in Parse.REMOTE_URLS:
             r.delete(url)
 
-    def __get_operator_values(self, chunk: pd.DataFrame) -> list[dict]:
-        """Готовит данные для пакетной загрузки в таблицу Operator
+    @staticmethod
+    def _prepare_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+        """Векторно готовит порцию исходных данных к загрузке
 
         :param chunk: исходные данные
         :type chunk: pd.DataFrame
-        :return: данные для загрузки
-        :rtype: list[dict]
+        :return: столбцы lower, upper, block, operator_inn, operator_name,
+            reg_name, reg_sub_name
+        :rtype: pd.DataFrame
         """
-        chunk["ИНН"] = chunk["ИНН"].replace(np.nan, None)
-        values_set = set(
-            [(x, y) for x, y in zip(chunk["ИНН"], chunk["Оператор"])]
+        prefix = chunk["АВС/ DEF"].to_numpy(np.int64) * PREFIX_MP
+        lower = prefix + chunk["От"].to_numpy(np.int64)
+        upper = prefix + chunk["До"].to_numpy(np.int64)
+        inn = chunk["ИНН"]
+        # "Подрегион|Регион" или просто "Регион". Различных регионов в
+        # порции мало, поэтому разбиваются только уникальные значения.
+        # Пустой регион - явная пустая строка, а не код -1, который
+        # указал бы на последний регион порции.
+        codes, uniques = pd.factorize(chunk["Регион"].fillna(""))
+        parts = [region.split("|") for region in uniques]
+        reg_names = np.array(
+            [x[1] if len(x) > 1 else x[0] for x in parts], dtype=object
+        )
+        reg_sub_names = np.array(
+            [x[0] if len(x) > 1 else "" for x in parts], dtype=object
+        )
+        return pd.DataFrame(
+            {
+                "lower": lower,
+                "upper": upper,
+                "block": lower // BLOCK_MP,
+                "operator_inn": np.where(
+                    inn.isna().to_numpy(),
+                    None,
+                    inn.fillna(0).to_numpy(np.int64).astype(object),
+                ),
+                "operator_name": chunk["Оператор"].to_numpy(),
+                "reg_name": reg_names[codes],
+                "reg_sub_name": reg_sub_names[codes],
+            }
         )
-        return [{"inn": x, "name": y} for x, y in values_set]
 
-    def __get_region_values(self, chunk: pd.DataFrame) -> list[dict]:
-        """Готовит данные для пакетной загрузки в таблицу Region
+    def __get_phone_values(self, batch: pd.DataFrame) -> list[dict]:
+        """Готовит данные для пакетной загрузки в таблицу Phone
 
-        :param chunk: исходные данные
-        :type chunk: pd.DataFrame
+        :param batch: подготовленная порция данных
+        :type batch: pd.DataFrame
         :return: данные для загрузки
         :rtype: list[dict]
         """
-        values_set = set(
-            [
-                tuple(x)
-                for x in map(lambda item: item.split("|"), chunk["Регион"])
-            ]
-        )
-        return [
-            {"name": x[0], "sub_name": ""}
-            if len(x) < 2
-            else {"name": x[1], "sub_name": x[0]}
-            for x in values_set
-        ]
+        return batch[
+            ["lower", "upper", "block", "operator_id", "region_id"]
+        ].to_dict("records")
 
-    def __get_phone_values(self, chunk: pd.DataFrame) -> list[dict]:
-        """Готовит данные для пакетной загрузки в таблицу Phone
+    def __get_phone_records(self, batch: pd.DataFrame) -> list[tuple]:
+        """Готовит данные для загрузки в таблицу Phone через COPY
 
-        :param chunk: исходные данные
-        :type chunk: pd.DataFrame
+        :param batch: подготовленная порция данных
+        :type batch: pd.DataFrame
         :return: данные для загрузки
-        :rtype: list[dict]
+        :rtype: list[tuple]
         """
-        return [
-            {
-                "range": Range(
-                    (pm := int(prefix * PREFIX_MP)) + int(start),
-                    pm + int(end),
-                    bounds="[]",
-                ),
-                "reg_name": reg_splitted[1]
-                if len(reg_splitted := region.split("|")) > 1
-                else reg_splitted[0],
-                "reg_sub_name": reg_splitted[0]
-                if len(reg_splitted) > 1
-                else "",
-                "operator_inn": inn,
-                "operator_name": name,
-            }
-            for prefix, start, end, region, inn, name in zip(
-                chunk["АВС/ DEF"],
-                chunk["От"],
-                chunk["До"],
-                chunk["Регион"],
-                chunk["ИНН"],
-                chunk["Оператор"],
+        return list(
+            zip(
+                *(
+                    batch[column].tolist()
+                    for column in (
+                        "lower",
+                        "upper",
+                        "operator_id",
+                        "region_id",
+                    )
+                )
             )
-        ]
+        )
 
     async def _delete_file_data(self, file_name: str):
         """Удаляет в базе данных данные файла, который будет загружаться.
@@ -183,14 +610,78 @@ class Parse:
         :param file_name: имя или url файла для загрузки
         :type file_name: str
         """
-        ranges = [
-            Range(3000000000, 4000000000),
-            Range(4000000000, 5000000000),
-            Range(8000000000, 9000000000),
-            Range(9000000000, 10000000000),
-        ]
-        nums_ranges = dict(zip(self.REMOTE_URLS, ranges))
-        await crud.delete_range(self.conn, nums_ranges[file_name])
+        await crud.delete_block(self.conn, self.get_file_block(file_name))
+
+    async def _create_shadow(self, file_name: str, etag: str):
+        """Создаёт теневую секцию блока нумерации, в которую будет
+        загружаться файл. С import_checkpoint оставляет теневую секцию
+        прерванного импорта той же версии файла.
+
+        :param file_name: имя или url файла для загрузки
+        :type file_name: str
+        :param etag: ETag загружаемого файла
+        :type etag: str
+        """
+        block = self.get_file_block(file_name)
+        await crud.lock_shadow(self.conn, block)
+        self.table = crud.shadow_table(block)
+        self.done = {}
+        if settings.import_checkpoint:
+            self.checkpoint = file_name
+            done = await asyncio.to_thread(
+                self.get_done_chunks, file_name, etag, self.db
+            )
+            if done is not None and await crud.shadow_exists(self.conn, block):
+                self.done = done
+                logging.info(
+                    f"{file_name}: продолжение импорта, загружено "
+                    f"{len(done)} порций, {sum(done.values())} строк"
+                )
+                return
+            # Прогресс удаляется до пересоздания секции, а ETag
+            # записывается после, чтобы обрыв между шагами не оставил
+            # порции, отмеченные загруженными в пустой секции.
+            await asyncio.to_thread(
+                self.delete_redis_checkpoint, file_name, self.db
+            )
+        # Теневая секция создаётся отдельной транзакцией: её загрузчики
+        # пишут через свои соединения, а внешние ключи на operator и
+        # region, созданные в self.conn, до конца импорта блокировали
+        # бы вставку новых операторов и регионов стадией подготовки.
+        async with self.engine.begin() as conn:
+            await crud.create_shadow(conn, block)
+        if settings.import_checkpoint:
+            await asyncio.to_thread(
+                self.set_redis_checkpoint,
+                file_name,
+                {"etag": etag, "chunk_size": settings.import_chunk_size},
+                self.db,
+            )
+
+    async def _write_batch(self, conn: AsyncConnection, batch: pd.DataFrame):
+        """Грузит подготовленную порцию в базу данных
+
+        :param conn: Соединение загрузчика
+        :type conn: AsyncConnection
+        :param batch: подготовленная порция с id операторов и регионов
+        :type batch: pd.DataFrame
+        """
+        if batch.empty:
+            return
+        if settings.import_mode == "incremental":
+            # Вставленные строки считает apply_staged_diff
+            await crud.stage_phones(conn, self.__get_phone_records(batch))
+            return
+        if settings.import_loader == "copy":
+            inserted = await crud.copy_phones(
+                conn, self.__get_phone_records(batch), self.table
+            )
+        else:
+            inserted = await crud.upsert_phones(
+                conn, self.__get_phone_values(batch), self.table
+            )
+        self.inserted += inserted
+        self.conflicts += len(batch) - inserted
 
     async def _process_chunk(self, chunk: pd.DataFrame):
         """Грузит порцию данных из файла в базу данных
@@ -198,36 +689,291 @@ class Parse:
         :param chunk: Порция исходных данных
         :type chunk: pd.DataFrame
         """
-        await crud.upsert_operators(
-            self.conn, self.__get_operator_values(chunk)
+        batch = self._prepare_chunk(chunk)
+        if settings.import_validate:
+            batch = self.validator.validate(chunk, batch)
+        batch = await self.dimensions.resolve(self.conn, batch)
+        await self._write_batch(self.conn, batch)
+
+    def _add_timing(self, stage: str, started: float) -> None:
+        """Добавляет время работы стадии импорта
+
+        :param stage: Название стадии
+        :type stage: str
+        :param started: Время начала, time.perf_counter()
+        :type started: float
+        """
+        self.timings[stage] = (
+            self.timings.get(stage, 0.0) + time.perf_counter() - started
+        )
+
+    async def _read_stage(self, file_name: str, chunks: asyncio.Queue):
+        """Читает и разбирает csv файл порциями в отдельном потоке
+
+        :param file_name: путь к локальной копии файла
+        :type file_name: str
+        :param chunks: Очередь прочитанных порций с их номерами
+        :type chunks: asyncio.Queue
+        """
+        started = time.perf_counter()
+        reader = await asyncio.to_thread(
+            pd.read_csv,
+            file_name,
+            sep=";",
+            chunksize=settings.import_chunk_size,
+            on_bad_lines="skip",
+        )
+        number = 0
+        while (
+            chunk := await asyncio.to_thread(next, reader, None)
+        ) is not None:
+            self._add_timing("read", started)
+            self.parsed += len(chunk)
+            await chunks.put((number, chunk))
+            number += 1
+            started = time.perf_counter()
+        await chunks.put(None)
+
+    async def _prepare_stage(
+        self,
+        chunks: asyncio.Queue,
+        batches: asyncio.Queue,
+        writers: int,
+    ):
+        """Готовит порции к загрузке и заполняет id операторов и регионов
+
+        :param chunks: Очередь прочитанных порций
+        :type chunks: asyncio.Queue
+        :param batches: Очередь подготовленных порций
+        :type batches: asyncio.Queue
+        :param writers: Число загрузчиков
+        :type writers: int
+        """
+        # Новые операторы и регионы фиксируются сразу, чтобы на них
+        # могли ссылаться строки из любого соединения загрузчиков.
+        async with self.engine.connect() as conn:
+            while (item := await chunks.get()) is not None:
+                number, chunk = item
+                started = time.perf_counter()
+                batch = await asyncio.to_thread(self._prepare_chunk, chunk)
+                self._add_timing("prepare", started)
+                if settings.import_validate:
+                    started = time.perf_counter()
+                    batch = await asyncio.to_thread(
+                        self.validator.validate, chunk, batch
+                    )
+                    self._add_timing("validate", started)
+                if number in self.done:
+                    # Порция зафиксирована прерванным импортом: проверка
+                    # нужна ради пересечений с остальными порциями, а
+                    # счётчики берутся из прогресса. Строки, отброшенные
+                    # тогда по ON CONFLICT, считаются вставленными.
+                    self.rows += self.done[number]
+                    self.inserted += self.done[number]
+                    self.chunks += 1
+                    continue
+                started = time.perf_counter()
+                batch = await self.dimensions.resolve(conn, batch)
+                await conn.commit()
+                self._add_timing("resolve", started)
+                await batches.put((number, batch))
+        for _ in range(writers):
+            await batches.put(None)
+
+    async def _write_stage(
+        self, batches: asyncio.Queue, conn: AsyncConnection, commit: bool
+    ):
+        """Грузит подготовленные порции в базу данных
+
+        :param batches: Очередь подготовленных порций
+        :type batches: asyncio.Queue
+        :param conn: Соединение загрузчика
+        :type conn: AsyncConnection
+        :param commit: Фиксировать каждую порцию
+        :type commit: bool
+        """
+        while (item := await batches.get()) is not None:
+            number, batch = item
+            started = time.perf_counter()
+            await self._write_batch(conn, batch)
+            if commit:
+                await conn.commit()
+            if self.checkpoint:
+                # Порция уже зафиксирована: если запись прогресса не
+                # удастся, повторная вставка будет пропущена по
+                # ограничению исключения (ON CONFLICT DO NOTHING).
+                await asyncio.to_thread(
+                    self.set_redis_checkpoint,
+                    self.checkpoint,
+                    {f"chunk:{number}": len(batch)},
+                    self.db,
+                )
+            self._add_timing("write", started)
+            self.rows += len(batch)
+            self.chunks += 1
+            if self.task_id:
+                await asyncio.to_thread(
+                    self.publish_status, self.get_progress()
+                )
+
+    async def _run_pipeline(self, file_name: str):
+        """Загружает файл конвейером: чтение, подготовка и загрузка идут
+        параллельно, очереди между ними ограничены import_queue_size.
+
+        :param file_name: путь к локальной копии файла
+        :type file_name: str
+        """
+        self.rows = 0
+        self.parsed = 0
+        self.inserted = 0
+        self.conflicts = 0
+        self.chunks = 0
+        self.timings = {}
+        self.started = started = time.perf_counter()
+        chunks = asyncio.Queue(settings.import_queue_size)
+        batches = asyncio.Queue(settings.import_queue_size)
+        async with contextlib.AsyncExitStack() as stack:
+            if settings.import_mode == "shadow" and (
+                settings.import_writers > 1 or settings.import_checkpoint
+            ):
+                # Порции пишутся в теневую секцию и фиксируются сразу,
+                # атомарной остаётся подмена секции в self.conn.
+                writers = [
+                    (
+                        await stack.enter_async_context(self.engine.connect()),
+                        True,
+                    )
+                    for _ in range(settings.import_writers)
+                ]
+            else:
+                writers = [(self.conn, False)]
+            tasks = [
+                asyncio.create_task(self._read_stage(file_name, chunks)),
+                asyncio.create_task(
+                    self._prepare_stage(chunks, batches, len(writers))
+                ),
+                *[
+                    asyncio.create_task(self._write_stage(batches, *writer))
+                    for writer in writers
+                ],
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        self.elapsed = elapsed = time.perf_counter() - started
+        logging.info(
+            f"{file_name}: {self.rows} строк за {elapsed:.1f} с "
+            f"({self.rows / elapsed:.0f} строк/с), стадии: "
+            + ", ".join(f"{k} {v:.1f} с" for k, v in self.timings.items())
         )
-        await crud.upsert_regions(self.conn, self.__get_region_values(chunk))
-        await crud.upsert_phones(self.conn, self.__get_phone_values(chunk))
+        if self.validator.counts:
+            logging.warning(
+                f"{file_name}: отброшены строки {self.validator.counts}, "
+                f"отчёт {self.validator.report}"
+            )
 
     async def parse_csv(
-        self, file_name: str, is_filtered: bool = False
-    ) -> None:
+        self, file_name: str, is_filtered: bool = False, source: Path = None
+    ) -> bool:
         """Парсит и загружает данные из csv файла в базу данных
 
         :param file_name: имя или url файла для загрузки
         :type file_name: str
+        :param source: Локальная копия файла, которая загружается вместо
+            скачивания по url, defaults to None
+        :type source: Path, optional
+        :return: Данные реестра изменились
+        :rtype: bool
         """
-        etag = self.get_file_etag(file_name)
-        if is_filtered and etag == self.get_redis_etag(file_name):
-            return
-        ssl._create_default_https_context = ssl._create_unverified_context
+        self.publish_status(
+            {"file": file_name, "state": "running", "started_at": time.time()}
+        )
+        async with Downloader() as downloader:
+            if source is None:
+                etag = await downloader.get_etag(file_name)
+            else:
+                # ETag локального файла - его размер и время изменения
+                stat = os.stat(source)
+                etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+            if is_filtered and etag == self.get_redis_etag(file_name, self.db):
+                self.publish_status(
+                    {
+                        "etag": etag,
+                        "state": "skipped",
+                        "finished_at": time.time(),
+                    }
+                )
+                return False
+            if source is None:
+                source, etag = await downloader.fetch(file_name, etag)
+        self.publish_status({"etag": etag})
+        self.dimensions = DimensionCache()
         async with self.engine.connect() as self.conn:
             try:
-                await self._delete_file_data(file_name)
-                for chunk in pd.read_csv(
-                    file_name,
-                    sep=";",
-                    chunksize=CHUNK_SIZE,
-                    on_bad_lines="skip",
-                ):
-                    await self._process_chunk(chunk)
+                block = self.get_file_block(file_name)
+                self.validator = RangeValidator(
+                    block,
+                    Path(settings.import_report_dir)
+                    / f"{Path(file_name).stem}-rejected.csv",
+                )
+                changed = True
+                if settings.import_mode == "shadow":
+                    await self._create_shadow(file_name, etag)
+                elif settings.import_mode == "incremental":
+                    await crud.reset_stage(self.conn)
+                else:
+                    await self._delete_file_data(file_name)
+                await self._run_pipeline(str(source))
+                if settings.import_mode == "shadow":
+                    # Читатели видят старую секцию до этого момента
+                    await crud.swap_shadow(self.conn, block)
+                elif settings.import_mode == "incremental":
+                    counts = await crud.apply_staged_diff(self.conn, block)
+                    self.inserted = counts["inserted"] + counts["updated"]
+                    changed = any(counts.values())
+                    logging.info(f"Изменения в {file_name}: {counts}")
+                if changed:
+                    # Версия фиксируется вместе с данными: по ней API
+                    # проверяет, что реплика уже применила этот импорт.
+                    version = await crud.bump_dataset_version(
+                        self.conn,
+                        block,
+                        self.get_redis_version(self.db, block) + 1,
+                    )
                 await self.conn.commit()
-                self.set_redis_etag(file_name, etag)
+                if self.checkpoint:
+                    self.delete_redis_checkpoint(file_name, self.db)
+                self.set_redis_etag(file_name, etag, self.db)
+                self.set_redis_metrics(file_name, self.get_metrics(), self.db)
+                if settings.import_mode == "incremental":
+                    self.set_redis_diff(file_name, counts, self.db)
+                if changed:
+                    self.bump_redis_version(block, self.db, version)
+                self.publish_status(
+                    {
+                        **self.get_progress(),
+                        "state": "success",
+                        "changed": int(changed),
+                        "finished_at": time.time(),
+                    }
+                )
+                return changed
             except DBAPIError as err:
                 logging.warning(f"Ошибка в обработке файла: {err}")
                 await self.conn.rollback()
+                if self.checkpoint:
+                    # Задача Celery будет повторена и продолжит импорт,
+                    # статус запишет задача
+                    raise
+                self.publish_status(
+                    {
+                        "state": "failed",
+                        "error": str(err.orig or err),
+                        "finished_at": time.time(),
+                    }
+                )
+                return False
@@ -0,0 +1,92 @@
+"""Двоичный снимок реестра для поиска номеров в API. Файл отображается
+в память (mmap), поэтому все воркеры uvicorn используют одну копию в
+кэше страниц, а массивы читаются без копирования.
+
+Формат файла:
+    заголовок 64 байта: магия, версия реестра, число диапазонов,
+    длина таблицы строк;
+    начала диапазонов, int64[n];
+    концы диапазонов (не включительно), int64[n];
+    индексы операторов, int32[n];
+    индексы регионов, int32[n];
+    таблица строк, JSON: операторы [ИНН, название] и регионы
+    [регион, подрегион].
+"""
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"ATRAXSN1"
+HEADER = struct.Struct("<8sQQQ")
+HEADER_SIZE = 64
+
+
+def write_snapshot(path: Path, version: int, data: tuple) -> None:
+    """Записывает снимок во временный файл и атомарно подменяет им
+    прежний
+
+    :param path: Путь к файлу снимка
+    :type path: Path
+    :param version: Версия реестра
+    :type version: int
+    :param data: Массивы и списки названий LookupIndex
+    :type data: tuple
+    """
+    starts, ends, operator_idx, region_idx, operators, regions = data
+    strings = json.dumps(
+        {"operators": operators, "regions": regions}, ensure_ascii=False
+    ).encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as file:
+        file.write(
+            HEADER.pack(MAGIC, version or 0, len(starts), len(strings)).ljust(
+                HEADER_SIZE, b"\0"
+            )
+        )
+        for array, dtype in (
+            (starts, np.int64),
+            (ends, np.int64),
+            (operator_idx, np.int32),
+            (region_idx, np.int32),
+        ):
+            file.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        file.write(strings)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path: Path) -> tuple[int, tuple]:
+    """Отображает снимок в память
+
+    :param path: Путь к файлу снимка
+    :type path: Path
+    :raises ValueError: Файл не является снимком реестра
+    :return: Версия реестра и данные для LookupIndex
+    :rtype: tuple[int, tuple]
+    """
+    with open(path, "rb") as file:
+        # Отображение остаётся действительным после закрытия файла и
+        # живёт, пока на него ссылаются массивы.
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, count, strings_length = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} не является снимком реестра")
+    offset = HEADER_SIZE
+    arrays = []
+    for dtype in (np.int64, np.int64, np.int32, np.int32):
+        arrays.append(np.frombuffer(buffer, dtype, count, offset))
+        offset += count * np.dtype(dtype).itemsize
+    if len(buffer) - offset != strings_length:
+        raise ValueError(f"{path}: снимок записан не полностью")
+    strings = json.loads(buffer[offset:].decode())
+    return version, (
+        *arrays,
+        [tuple(row) for row in strings["operators"]],
+        [tuple(row) for row in strings["regions"]],
+    )
@@ -1,10 +1,19 @@
 import asyncio
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
 
-from celery import Celery, group
+import httpx
+from celery import Celery
 from celery.schedules import crontab
+from sqlalchemy.exc import DBAPIError
 
 from .config import settings
-from .database import engine
+from .database import import_engine
+from .enrich import enrich_file, get_index
+from .lookup import build_snapshot
 from .service import Parse
 
 celery = Celery("tasks", broker=f"redis://{settings.redis_host}")
@@ -19,14 +28,105 @@ celery.conf.beat_schedule = {
 }
 
 
+RETRY_ERRORS = (DBAPIError, httpx.HTTPError)
+
+
+@celery.task(
+    bind=True,
+    # Задача подтверждается после выполнения: при гибели воркера она
+    # будет выдана снова и с import_checkpoint продолжит импорт.
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=RETRY_ERRORS,
+    retry_backoff=True,
+    max_retries=settings.import_retries,
+)
+def celery_parse(self, file_name: str, is_filtered: bool = False, db: int = 0):
+    task_id = self.request.id
+    if not Parse.acquire_import_lock(file_name, task_id, db):
+        Parse.set_redis_status(
+            task_id,
+            {
+                "file": file_name,
+                "state": "rejected",
+                "error": "Файл уже загружается задачей "
+                f"{Parse.get_import_lock(file_name, db)}",
+                "finished_at": time.time(),
+            },
+            db,
+        )
+        return
+    try:
+        changed = asyncio.run(
+            Parse(import_engine, task_id, db).parse_csv(file_name, is_filtered)
+        )
+    except Exception as err:
+        final = (
+            not isinstance(err, RETRY_ERRORS)
+            or self.request.retries >= self.max_retries
+        )
+        values = {
+            "state": "failed" if final else "retrying",
+            "error": str(err),
+            "retries": self.request.retries,
+        }
+        if final:
+            values["finished_at"] = time.time()
+        Parse.set_redis_status(task_id, values, db)
+        if final:
+            Parse.release_import_lock(file_name, task_id, db)
+        raise
+    Parse.release_import_lock(file_name, task_id, db)
+    if changed and settings.lookup_backend == "snapshot":
+        celery_write_snapshot.delay()
+
+
+def queue_parse(file_name: str, is_filtered: bool = False, db: int = 0) -> str:
+    """Ставит импорт файла в очередь, если файл не загружается другой
+    задачей
+
+    :param file_name: url файла
+    :type file_name: str
+    :param is_filtered: Пропустить файл с тем же ETag, defaults to False
+    :type is_filtered: bool, optional
+    :param db: Номер базы в Redis, defaults to 0
+    :type db: int, optional
+    :return: id задачи или None, если файл уже загружается
+    :rtype: str
+    """
+    task_id = uuid.uuid4().hex
+    if not Parse.acquire_import_lock(file_name, task_id, db):
+        return None
+    Parse.set_redis_status(
+        task_id,
+        {"file": file_name, "state": "queued", "queued_at": time.time()},
+        db,
+    )
+    try:
+        celery_parse.apply_async((file_name, is_filtered, db), task_id=task_id)
+    except Exception:
+        Parse.release_import_lock(file_name, task_id, db)
+        raise
+    return task_id
+
+
 @celery.task
-def celery_parse(file_name: str, is_filtered: bool = False):
-    asyncio.run(Parse(engine).parse_csv(file_name, is_filtered))
+def celery_write_snapshot():
+    asyncio.run(
+        build_snapshot(import_engine, Path(settings.registry_snapshot))
+    )
 
 
 @celery.task
 def celery_parse_all_csv(is_filtered: bool = False):
-    group(
-        celery_parse.s(file_name, is_filtered)
-        for file_name in Parse.REMOTE_URLS
-    )()
+    for file_name in Parse.REMOTE_URLS:
+        if queue_parse(file_name, is_filtered) is None:
+            logging.info(f"{file_name} уже загружается, пропущен")
+
+
+@celery.task
+def celery_enrich(source: str, target: str):
+    index = asyncio.run(get_index(import_engine))
+    rows = enrich_file(index, Path(source), Path(target))
+    os.remove(source)
+    return rows
@@ -11,7 +11,7 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
 from ..config import settings
-from ..dependencies import get_session
+from ..dependencies import get_redis_db, get_session
 from ..models import Base
 from ..router import router
 
@@ -47,7 +47,12 @@ async def override_get_session() -> AsyncSession:
         yield session
 
 
+def override_get_redis_db() -> int:
+    return 1
+
+
 app.dependency_overrides[get_session] = override_get_session
+app.dependency_overrides[get_redis_db] = override_get_redis_db
 client = TestClient(app)
 
 
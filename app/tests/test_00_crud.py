@@ -1,9 +1,14 @@
+import asyncio
+
 import pandas as pd
-from sqlalchemy import func, select
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import Range
 
 from .. import crud
+from ..config import settings
 from ..models import Phone
-from ..service import Parse
+from ..service import PREFIX_MP, Parse
 from .conftest import async_session_test, engine_test
 
 
@@ -35,6 +40,22 @@ async def test_parse(test_data: pd.DataFrame):
     )
 
 
+def test_prepare_empty_region():
+    data = pd.DataFrame(
+        {
+            "АВС/ DEF": [383, 383, 383],
+            "От": [0, 100, 200],
+            "До": [99, 199, 299],
+            "Оператор": ["Оператор"] * 3,
+            "Регион": ["г. Новосибирск|Новосибирская обл.", None, "Москва"],
+            "ИНН": [5902202276] * 3,
+        }
+    )
+    batch = Parse._prepare_chunk(data)
+    assert batch["reg_name"].tolist() == ["Новосибирская обл.", "", "Москва"]
+    assert batch["reg_sub_name"].tolist() == ["г. Новосибирск", "", ""]
+
+
 async def test_divided_data_insertion(divided_test_data: pd.DataFrame):
     existed = await get_count(Phone)
     await insert_data(divided_test_data)
@@ -66,6 +87,182 @@ async def test_range_removing():
     assert (before - after) == 3, f"Ошибка: было {before}, стало {after}."
 
 
+async def test_copy_loader(
+    monkeypatch,
+    test_data: pd.DataFrame,
+    divided_test_data: pd.DataFrame,
+    united_test_data: pd.DataFrame,
+):
+    monkeypatch.setattr(settings, "import_loader", "copy")
+    parse = Parse(engine_test)
+    async with engine_test.connect() as parse.conn:
+        for file_name in Parse.REMOTE_URLS:
+            await parse._delete_file_data(file_name)
+        await parse.conn.commit()
+    row, _ = test_data.shape
+    await insert_data(test_data)
+    inserted = await get_count(Phone)
+    assert inserted == row, f"Ошибка: из {row} записей добавлено {inserted}."
+    await insert_data(divided_test_data)
+    await insert_data(united_test_data)
+    existing = await get_count(Phone)
+    assert inserted == existing, "Ошибка: плохие данные добавились."
+    async with async_session_test() as session:
+        result = await crud.get_info(session, 3832857880)
+    assert result == (
+        5902202276,
+        'АО "ЭР-Телеком Холдинг"',
+        "Новосибирская обл.",
+        "г. Новосибирск",
+    )
+
+
+@pytest.mark.parametrize("loader", ["insert", "copy"])
+async def test_conflict_metrics(
+    monkeypatch, test_data: pd.DataFrame, loader: str
+):
+    # Данные уже загружены: повторная порция целиком отбрасывается
+    # ограничением исключения и не считается вставленной.
+    monkeypatch.setattr(settings, "import_loader", loader)
+    parse = Parse(engine_test)
+    async with engine_test.connect() as parse.conn:
+        await parse._process_chunk(test_data)
+        await parse.conn.rollback()
+    metrics = parse.get_metrics()
+    assert metrics["rows:inserted"] == 0
+    assert metrics["rejected:conflict"] == len(test_data)
+
+
+async def test_shadow_swap(test_data: pd.DataFrame):
+    block_data = test_data[test_data["АВС/ DEF"] // 100 == 4]
+    row = block_data.iloc[0]
+    phone_num = int(row["АВС/ DEF"]) * PREFIX_MP + int(row["От"])
+    async with async_session_test() as session:
+        expected = await crud.get_info(session, phone_num)
+    assert expected is not None
+    before = await get_count(Phone)
+    parse = Parse(engine_test)
+    async with engine_test.connect() as parse.conn:
+        await parse._create_shadow(Parse.REMOTE_URLS[1], "etag")
+        await parse._process_chunk(block_data)
+        async with async_session_test() as session:
+            result = await crud.get_info(session, phone_num)
+        assert result == expected, "Ошибка: данные недоступны до подмены."
+        await crud.swap_shadow(parse.conn, 4)
+        await parse.conn.commit()
+    async with async_session_test() as session:
+        result = await crud.get_info(session, phone_num)
+    assert result == expected, "Ошибка: номер не найден в новой секции."
+    after = await get_count(Phone)
+    assert before == after, f"Ошибка: было {before}, стало {after}."
+
+
+async def test_checkpoint_resume(monkeypatch):
+    monkeypatch.setattr(settings, "import_checkpoint", True)
+    file_name = Parse.REMOTE_URLS[1]
+    Parse.delete_redis_checkpoint(file_name, 1)
+    parse = Parse(engine_test, db=1)
+    async with engine_test.connect() as parse.conn:
+        await parse._create_shadow(file_name, "etag")
+        assert parse.done == {}
+        await parse.conn.rollback()
+    Parse.set_redis_checkpoint(file_name, {"chunk:0": 10}, 1)
+    async with engine_test.connect() as parse.conn:
+        await parse._create_shadow(file_name, "etag")
+        assert parse.done == {0: 10}, "Ошибка: импорт не продолжен."
+        await parse._create_shadow(file_name, "new etag")
+        assert parse.done == {}, "Ошибка: продолжен импорт другого файла."
+        await parse.conn.rollback()
+    Parse.delete_redis_checkpoint(file_name, 1)
+    # Секция создана отдельной транзакцией, откат её не удаляет
+    async with engine_test.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS phone_4_shadow"))
+
+
+async def test_incremental_diff(monkeypatch, test_data: pd.DataFrame):
+    monkeypatch.setattr(settings, "import_mode", "incremental")
+    block_data = test_data[test_data["АВС/ DEF"] // 100 == 4].copy()
+    changed_data = block_data.copy()
+    changed_data.loc[changed_data.index[0], "Оператор"] = 'ООО "Новый"'
+    parse = Parse(engine_test)
+    async with engine_test.connect() as parse.conn:
+        for data, counts in (
+            (block_data, {"inserted": 0, "deleted": 0, "updated": 0}),
+            (block_data.iloc[1:], {"inserted": 0, "deleted": 1, "updated": 0}),
+            (changed_data, {"inserted": 0, "deleted": 0, "updated": 1}),
+        ):
+            await crud.reset_stage(parse.conn)
+            await parse._process_chunk(data)
+            assert await crud.apply_staged_diff(parse.conn, 4) == counts
+            await parse.conn.rollback()
+
+
+async def test_concurrent_imports(monkeypatch, tmp_path):
+    # Два файла с общими новыми операторами и регионами, порции по две
+    # строки: загрузчик каждого импорта держит транзакцию открытой, пока
+    # подготовка вставляет операторы и регионы другого.
+    monkeypatch.setattr(settings, "import_chunk_size", 2)
+    paths = []
+    for code in (301, 801):
+        path = tmp_path / f"{code}.csv"
+        pd.DataFrame(
+            {
+                "АВС/ DEF": code,
+                "От": range(0, 200, 10),
+                "До": range(9, 200, 10),
+                "Емкость": 10,
+                "Оператор": [f'ООО "Общий {i % 5}"' for i in range(20)],
+                "Регион": [f"Общий регион {i % 3}" for i in range(20)],
+                "ИНН": [7700000000 + i % 5 for i in range(20)],
+            }
+        ).to_csv(path, sep=";", index=False)
+        paths.append(path)
+
+    async def run(path):
+        parse = Parse(engine_test)
+        async with engine_test.connect() as parse.conn:
+            await parse._run_pipeline(str(path))
+            await parse.conn.commit()
+        return parse.rows
+
+    rows = await asyncio.wait_for(asyncio.gather(*map(run, paths)), timeout=30)
+    assert rows == [20, 20]
+    async with engine_test.connect() as conn:
+        operators = await crud.get_operator_ids(conn)
+        assert sum(name.startswith('ООО "Общий') for _, name in operators) == 5
+        for code in (301, 801):
+            lower = code * 10000000
+            await crud.delete_range(conn, Range(lower, lower + 10000000))
+        await conn.commit()
+
+
+async def test_shadow_pipeline(monkeypatch, tmp_path):
+    # Один загрузчик пишет через self.conn, а подготовка вставляет
+    # новых операторов и регионы своим соединением.
+    monkeypatch.setattr(settings, "import_mode", "shadow")
+    monkeypatch.setattr(settings, "import_chunk_size", 2)
+    path = tmp_path / "401.csv"
+    pd.DataFrame(
+        {
+            "АВС/ DEF": 401,
+            "От": range(0, 200, 10),
+            "До": range(9, 200, 10),
+            "Емкость": 10,
+            "Оператор": [f'ООО "Теневой {i % 5}"' for i in range(20)],
+            "Регион": [f"Теневой регион {i % 3}" for i in range(20)],
+            "ИНН": [7800000000 + i % 5 for i in range(20)],
+        }
+    ).to_csv(path, sep=";", index=False)
+    parse = Parse(engine_test)
+    async with engine_test.connect() as parse.conn:
+        await parse._create_shadow(Parse.REMOTE_URLS[1], "etag")
+        await asyncio.wait_for(parse._run_pipeline(str(path)), timeout=30)
+        assert parse.rows == 20
+        await parse.conn.rollback()
+    async with engine_test.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS phone_4_shadow"))
+
+
 # Redis stuff
 async def test_etags():
     Parse.clear_redis(1)
@@ -1,6 +1,12 @@
+import asyncio
+import json
+
 import pytest
 from fastapi import status
 
+from ..config import settings
+from ..ranges import ExportSlot
+from ..service import Parse
 from . import conftest as cnft
 
 
@@ -27,8 +33,125 @@ def test_num_not_in_base():
     assert response.json() == {"detail": "К сожалению, номер не найден."}
 
 
+def test_conditional_get():
+    response = cnft.client.get("/api/" + cnft.GOOD_NUM)
+    etag = response.headers["etag"]
+    assert "max-age" in response.headers["cache-control"]
+    response = cnft.client.get(
+        "/api/" + cnft.GOOD_NUM, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    response = cnft.client.get(
+        "/api/" + cnft.GOOD_NUM, headers={"If-None-Match": '"0.0"'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
 @pytest.mark.parametrize("phone_num", cnft.BAD_NUM_NOT_REGEX)
 def test_bad_num_not_regex(phone_num):
     response = cnft.client.get("/api/" + phone_num)
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
     assert "string does not match regex" in response.json()["detail"][0]["msg"]
+
+
+def test_batch():
+    response = cnft.client.post(
+        "/api/batch",
+        json={"numbers": [cnft.NUM_NOT_IN_BASE, cnft.GOOD_NUM]},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"phone_num": cnft.NUM_NOT_IN_BASE, "found": False, "info": None},
+        {
+            "phone_num": cnft.GOOD_NUM,
+            "found": True,
+            "info": {
+                "inn": 7707049388,
+                "operator": 'ПАО "Ростелеком"',
+                "region": "Российская Федерация",
+                "sub_region": "",
+            },
+        },
+    ]
+
+
+@pytest.mark.parametrize("phone_num", cnft.BAD_NUM_NOT_REGEX)
+def test_batch_bad_num_not_regex(phone_num):
+    response = cnft.client.post(
+        "/api/batch", json={"numbers": [cnft.GOOD_NUM, phone_num]}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert "string does not match regex" in response.json()["detail"][0]["msg"]
+
+
+def in_gaps(phone_num: str, gaps: list) -> bool:
+    return any(gap["start"] <= phone_num <= gap["end"] for gap in gaps)
+
+
+def test_gaps():
+    response = cnft.client.get("/api/gaps/" + cnft.NUM_NOT_IN_BASE[1:4])
+    assert response.status_code == status.HTTP_200_OK
+    assert in_gaps(cnft.NUM_NOT_IN_BASE, response.json())
+    response = cnft.client.get("/api/gaps/" + cnft.GOOD_NUM[1:4])
+    assert response.status_code == status.HTTP_200_OK
+    assert not in_gaps(cnft.GOOD_NUM, response.json())
+
+
+def test_ranges():
+    response = cnft.client.get(
+        "/api/ranges", params={"prefix": cnft.GOOD_NUM[:5]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    ranges = [json.loads(line) for line in response.text.splitlines()]
+    assert any(r["start"] <= cnft.GOOD_NUM <= r["end"] for r in ranges)
+    assert [r["start"] for r in ranges] == sorted(r["start"] for r in ranges)
+    response = cnft.client.get(
+        "/api/ranges",
+        params={"prefix": cnft.GOOD_NUM[:5], "after": ranges[0]["start"]},
+    )
+    assert [json.loads(line) for line in response.text.splitlines()] == (
+        ranges[1:]
+    )
+    response = cnft.client.get(
+        "/api/ranges", params={"inn": 7707049388, "format": "csv"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    lines = response.text.splitlines()
+    assert lines[0] == "start;end;inn;operator;region;sub_region"
+    assert all(line.split(";")[2] == "7707049388" for line in lines[1:])
+    # Выгрузки освободили слоты; пока все слоты заняты, ответ 429
+    slots = [ExportSlot() for _ in range(settings.ranges_max_streams)]
+    for slot in slots:
+        assert asyncio.run(slot.acquire())
+    response = cnft.client.get(
+        "/api/ranges", params={"prefix": cnft.GOOD_NUM[:5]}
+    )
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    for slot in slots:
+        slot.release()
+
+
+def test_parse_status():
+    Parse.set_redis_status(
+        "test-task",
+        {
+            "file": Parse.REMOTE_URLS[0],
+            "state": "running",
+            "chunks": 2,
+            "rows": 20000,
+            "stage:read": 0.5,
+        },
+        1,
+    )
+    response = cnft.client.get("/api/parse/status/test-task")
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["state"] == "running"
+    assert result["rows"] == 20000
+    assert result["stages"] == {"read": 0.5}
+    response = cnft.client.get("/api/parse/status")
+    assert response.status_code == status.HTTP_200_OK
+    assert "test-task" in [item["task_id"] for item in response.json()]
+    response = cnft.client.get("/api/parse/status/unknown-task")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,70 @@
+from .. import crud
+from ..cache import LookupCache
+from ..gaps import GapIndex
+from ..lookup import LookupIndex
+from ..service import Parse
+from .conftest import async_session_test, engine_test
+
+# Есть в базе, нет в базе (дыра между диапазонами), до первого диапазона
+NUMS = [3832857880, 9703500007, 9374382838, 4963477626, 1000000000]
+
+
+async def test_lookup_index_matches_sql():
+    index = LookupIndex()
+    await index.load(engine_test)
+    assert index.loaded
+    async with async_session_test() as session:
+        for num in NUMS:
+            expected = await crud.get_info(session, num)
+            result = index.find(num)
+            assert result == (tuple(expected) if expected else None), num
+
+
+async def test_lookup_cache():
+    cache = LookupCache(1)
+    await cache.redis.flushdb()
+    async with async_session_test() as session:
+        for num in NUMS:
+            expected = await crud.get_info(session, num)
+            expected = tuple(expected) if expected else None
+            assert await cache.get_info(session, num) == expected, num
+            assert await cache.get_info(session, num) == expected, num
+    assert cache.hits == len(NUMS)
+    assert cache.misses == len(NUMS)
+
+
+async def test_lookup_cache_block_version():
+    cache = LookupCache(1)
+    async with async_session_test() as session:
+        await cache.get_info(session, 3832857880)
+        await cache.get_info(session, 9703500007)
+        Parse.bump_redis_version(9, 1)
+        cache.versions.invalidate()
+        hits = cache.hits
+        await cache.get_info(session, 3832857880)
+        assert cache.hits == hits + 1
+        await cache.get_info(session, 9703500007)
+        assert cache.hits == hits + 1
+
+
+async def test_lookup_snapshot(tmp_path):
+    index = LookupIndex()
+    await index.load(engine_test, 5)
+    path = tmp_path / "registry.bin"
+    index.save(path)
+    snapshot = LookupIndex()
+    snapshot.load_snapshot(path)
+    assert snapshot.version == 5
+    assert len(snapshot) == len(index)
+    for num in NUMS:
+        assert snapshot.find(num) == index.find(num), num
+
+
+async def test_gap_index():
+    index = GapIndex()
+    await index.load(engine_test)
+    async with async_session_test() as session:
+        for num in NUMS:
+            if index.contains(num):
+                assert await crud.get_info(session, num) is None, num
+    assert not index.contains(3832857880)
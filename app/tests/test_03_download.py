@@ -0,0 +1,97 @@
+import httpx
+import pytest
+
+from ..config import settings
+from ..download import Downloader
+
+URL = "https://example.com/ABC-3xx.csv"
+ETAG = '"abc-1"'
+CONTENT = "АВС/ DEF;От;До\n" + "301;0;9999999\n" * 1000
+BODY = CONTENT.encode()
+
+
+class FileServer:
+    """Отдаёт BODY с поддержкой ETag и Range, считает запросы"""
+
+    def __init__(self, etag: str = ETAG) -> None:
+        self.etag = etag
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        headers = {"ETag": self.etag}
+        if request.method == "HEAD":
+            return httpx.Response(200, headers=headers)
+        range_header = request.headers.get("Range")
+        if range_header and request.headers.get("If-Range") == self.etag:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(BODY):
+                headers["Content-Range"] = f"bytes */{len(BODY)}"
+                return httpx.Response(416, headers=headers)
+            return httpx.Response(206, headers=headers, content=BODY[start:])
+        return httpx.Response(200, headers=headers, content=BODY)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "download_cache_dir", str(tmp_path))
+    return tmp_path
+
+
+async def test_download_and_cache_hit(cache_dir):
+    server = FileServer()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+    async with Downloader(client) as downloader:
+        etag = await downloader.get_etag(URL)
+        path, etag = await downloader.fetch(URL, etag)
+        assert etag == ETAG
+        assert path.read_bytes() == BODY
+        assert len(server.requests) == 2
+        assert await downloader.fetch(URL, etag) == (path, ETAG)
+        assert len(server.requests) == 2
+    await client.aclose()
+
+
+async def test_download_resume(cache_dir):
+    server = FileServer()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+    async with Downloader(client) as downloader:
+        part = downloader.get_path(URL, ETAG).with_suffix(".part")
+        part.write_bytes(BODY[:100])
+        path, _ = await downloader.fetch(URL, ETAG)
+        assert server.requests[0].headers["Range"] == "bytes=100-"
+        assert path.read_bytes() == BODY
+        assert not part.exists()
+    await client.aclose()
+
+
+async def test_download_complete_part(cache_dir):
+    server = FileServer()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+    async with Downloader(client) as downloader:
+        part = downloader.get_path(URL, ETAG).with_suffix(".part")
+        part.write_bytes(BODY)
+        path, _ = await downloader.fetch(URL, ETAG)
+        assert len(server.requests) == 1
+        assert path.read_bytes() == BODY
+        assert not part.exists()
+        # Испорченный .part длиннее файла загружается заново
+        path.unlink()
+        part.write_bytes(BODY + b"x")
+        path, _ = await downloader.fetch(URL, ETAG)
+        assert "Range" not in server.requests[-1].headers
+        assert path.read_bytes() == BODY
+    await client.aclose()
+
+
+async def test_download_new_version(cache_dir):
+    server = FileServer()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+    async with Downloader(client) as downloader:
+        old_path, _ = await downloader.fetch(URL, ETAG)
+        server.etag = '"abc-2"'
+        path, etag = await downloader.fetch(URL, server.etag)
+        assert etag == server.etag
+        assert path != old_path
+        assert not old_path.exists()
+    await client.aclose()
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from ..service import Parse
+from ..validation import (
+    DUPLICATE,
+    INVALID_RANGE,
+    OUT_OF_BLOCK,
+    OVERLAP,
+    RangeValidator,
+)
+
+
+def test_validator_reasons():
+    validator = RangeValidator(9)
+    lower = np.array(
+        [9000000000, 9000000000, 9000000005, 9000000030, 3000000000]
+    )
+    upper = np.array(
+        [9000000009, 9000000009, 9000000025, 9000000020, 3000000001]
+    )
+    assert validator.check(lower, upper).tolist() == [
+        None,
+        DUPLICATE,
+        OVERLAP,
+        INVALID_RANGE,
+        OUT_OF_BLOCK,
+    ]
+    # Следующая порция проверяется и по диапазонам прежних
+    assert validator.check(
+        np.array([9000000008, 9000000000, 9000000010]),
+        np.array([9000000012, 9000000009, 9000000019]),
+    ).tolist() == [OVERLAP, DUPLICATE, None]
+    assert validator.counts == {
+        DUPLICATE: 2,
+        OVERLAP: 2,
+        INVALID_RANGE: 1,
+        OUT_OF_BLOCK: 1,
+    }
+
+
+def test_validator_first_come():
+    validator = RangeValidator()
+    reasons = validator.check(np.array([50, 10, 0]), np.array([60, 55, 20]))
+    assert reasons.tolist() == [None, OVERLAP, None]
+    # Диапазон, пересекающийся только с отброшенным, принимается
+    validator = RangeValidator()
+    reasons = validator.check(np.array([0, 20, 0]), np.array([10, 30, 100]))
+    assert reasons.tolist() == [None, None, OVERLAP]
+    validator = RangeValidator()
+    reasons = validator.check(np.array([0, 5, 15]), np.array([10, 20, 25]))
+    assert reasons.tolist() == [None, OVERLAP, None]
+    assert validator.lowers.tolist() == [0, 15]
+
+
+def test_validator_report(tmp_path, divided_test_data: pd.DataFrame):
+    report = tmp_path / "rejected.csv"
+    validator = RangeValidator(report=report)
+    data = pd.concat([divided_test_data, divided_test_data.iloc[:1]])
+    batch = validator.validate(data, Parse._prepare_chunk(data))
+    rejected = pd.read_csv(report, sep=";")
+    assert len(batch) + len(rejected) == len(data)
+    assert DUPLICATE in rejected["reason"].tolist()
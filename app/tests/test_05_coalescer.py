@@ -0,0 +1,32 @@
+import asyncio
+import contextlib
+
+from .. import crud
+from ..coalescer import LookupCoalescer
+
+
+@contextlib.asynccontextmanager
+async def fake_session():
+    yield None
+
+
+async def test_coalescer(monkeypatch):
+    calls = []
+
+    async def get_info_batch(session, phone_nums):
+        calls.append(phone_nums)
+        await asyncio.sleep(0.01)
+        return [(num,) if num % 2 else None for num in phone_nums]
+
+    monkeypatch.setattr(crud, "get_info_batch", get_info_batch)
+    coalescer = LookupCoalescer(fake_session, window=0.005, max_batch=50)
+    nums = list(range(120)) + [1, 1, 2]
+    results = await asyncio.gather(*map(coalescer.get_info, nums))
+    assert results == [(num,) if num % 2 else None for num in nums]
+    assert coalescer.lookups == len(nums)
+    assert coalescer.batches == len(calls) == 3
+    assert sorted(set(sum(calls, []))) == list(range(120))
+    assert max(map(len, calls)) == 50
+    # Без нагрузки номер уходит в базу без ожидания окна
+    coalescer.window = 10
+    assert await asyncio.wait_for(coalescer.get_info(3), 1) == (3,)
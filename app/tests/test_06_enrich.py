@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ..config import settings
+from ..enrich import enrich_chunk, enrich_file, enrich_stream
+from ..lookup import LookupIndex
+from ..snapshot import write_snapshot
+
+OPERATORS = [(5902202276, 'АО "ЭР-Телеком Холдинг"'), (7702070139, "Б; В")]
+REGIONS = [("Новосибирская обл.", "г. Новосибирск"), ("Москва", "")]
+EXPECTED = [
+    '79000000000;true;5902202276;"АО ""ЭР-Телеком Холдинг""";'
+    "Новосибирская обл.;г. Новосибирск",
+    '79000000150;true;7702070139;"Б; В";Москва;',
+    "79000000100;false;;;;",
+    "79000000099;true;5902202276;"
+    '"АО ""ЭР-Телеком Холдинг""";Новосибирская обл.;г. Новосибирск',
+]
+
+
+@pytest.fixture
+def index(tmp_path) -> LookupIndex:
+    path = tmp_path / "registry.bin"
+    write_snapshot(
+        path,
+        1,
+        (
+            np.array([9000000000, 9000000150]),
+            np.array([9000000100, 9000000200]),
+            np.array([0, 1]),
+            np.array([0, 1]),
+            OPERATORS,
+            REGIONS,
+        ),
+    )
+    index = LookupIndex()
+    index.load_snapshot(path)
+    return index
+
+
+def test_enrich_numeric(index: LookupIndex):
+    phones = pd.Series([79000000000, 79000000150, 79000000100, 79000000099])
+    assert enrich_chunk(index, phones).splitlines() == EXPECTED
+
+
+def test_enrich_strings(index: LookupIndex):
+    phones = pd.Series([" 79000000000", "+79000000150", "abc", None])
+    assert enrich_chunk(index, phones).splitlines() == [
+        EXPECTED[0],
+        EXPECTED[1],
+        "abc;false;;;;",
+        ";false;;;;",
+    ]
+
+
+async def test_enrich_stream(index: LookupIndex, monkeypatch):
+    monkeypatch.setattr(settings, "enrich_chunk_bytes", 16)
+    data = "\n".join(line.split(";")[0] for line in EXPECTED).encode()
+
+    async def body():
+        for start in range(0, len(data), 5):
+            stop = start + 5
+            yield data[start:stop]
+
+    result = "".join([part async for part in enrich_stream(index, body())])
+    assert result.splitlines()[1:] == EXPECTED
+
+
+def test_enrich_file(index: LookupIndex, tmp_path):
+    source = tmp_path / "numbers.csv"
+    source.write_text("\n".join(line.split(";")[0] for line in EXPECTED))
+    target = tmp_path / "result.csv"
+    assert enrich_file(index, source, target) == len(EXPECTED)
+    assert target.read_text().splitlines()[1:] == EXPECTED
@@ -0,0 +1,47 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ..metrics import (
+    API_METRICS,
+    REQUEST_SECONDS,
+    Histogram,
+    MetricsEndpoint,
+    MetricsMiddleware,
+    render,
+)
+
+
+def test_histogram():
+    histogram = Histogram("test_seconds", "Тест", ("route",), (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "/a")
+    assert render([histogram]).splitlines()[2:] == [
+        'test_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_seconds_bucket{route="/a",le="1.0"} 3',
+        'test_seconds_bucket{route="/a",le="+Inf"} 4',
+        'test_seconds_sum{route="/a"} 6.05',
+        'test_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_metrics_endpoint():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"item_id": item_id}
+
+    metrics = MetricsEndpoint([])
+    app.add_route("/metrics", metrics.handle)
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/a")
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert REQUEST_SECONDS in API_METRICS
+    for status in (200, 422):
+        assert (
+            "atrax_http_request_duration_seconds_count{"
+            f'method="GET",route="/items/{{item_id}}",status="{status}"}} 1'
+        ) in response.text
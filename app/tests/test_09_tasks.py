@@ -0,0 +1,71 @@
+import uuid
+
+import httpx
+import pytest
+
+from ..service import Parse
+from ..tasks import celery_parse, queue_parse
+
+FILE_NAME = Parse.REMOTE_URLS[0]
+
+
+@pytest.fixture(autouse=True)
+def release_lock():
+    yield
+    task_id = Parse.get_import_lock(FILE_NAME, 1)
+    if task_id:
+        Parse.release_import_lock(FILE_NAME, task_id, 1)
+
+
+def test_import_lock():
+    assert Parse.acquire_import_lock(FILE_NAME, "first", 1)
+    assert not Parse.acquire_import_lock(FILE_NAME, "second", 1)
+    assert Parse.acquire_import_lock(FILE_NAME, "first", 1)
+    Parse.release_import_lock(FILE_NAME, "second", 1)
+    assert Parse.get_import_lock(FILE_NAME, 1) == "first"
+    Parse.release_import_lock(FILE_NAME, "first", 1)
+    assert Parse.acquire_import_lock(FILE_NAME, "second", 1)
+
+
+def test_queue_parse_duplicate(monkeypatch):
+    queued = []
+    monkeypatch.setattr(
+        celery_parse,
+        "apply_async",
+        lambda args, task_id: queued.append(task_id),
+    )
+    task_id = queue_parse(FILE_NAME, db=1)
+    assert task_id is not None
+    # Роут отвечает 409, когда queue_parse возвращает None
+    assert queue_parse(FILE_NAME, db=1) is None
+    assert queued == [task_id], "Ошибка: файл поставлен в очередь дважды."
+    assert Parse.get_import_lock(FILE_NAME, 1) == task_id
+    assert Parse.get_redis_status(task_id, 1)["state"] == "queued"
+
+
+def test_parse_retries(monkeypatch):
+    task_id = uuid.uuid4().hex
+    seen = []
+
+    async def parse_csv(self, file_name: str, is_filtered: bool):
+        seen.append(
+            (
+                Parse.get_import_lock(file_name, 1),
+                Parse.get_redis_status(task_id, 1),
+            )
+        )
+        raise httpx.ConnectError("Сервер недоступен")
+
+    monkeypatch.setattr(Parse, "parse_csv", parse_csv)
+    monkeypatch.setattr(celery_parse, "max_retries", 1)
+    assert Parse.acquire_import_lock(FILE_NAME, task_id, 1)
+    # Повтор задачи в apply выполняется сразу же
+    celery_parse.apply((FILE_NAME, False, 1), task_id=task_id)
+    (first_lock, _), (retry_lock, retry_status) = seen
+    assert first_lock == retry_lock == task_id, "Ошибка: блокировка снята."
+    assert retry_status["state"] == "retrying"
+    assert "finished_at" not in retry_status
+    status = Parse.get_redis_status(task_id, 1)
+    assert status["state"] == "failed"
+    assert "finished_at" in status
+    assert Parse.get_import_lock(FILE_NAME, 1) is None
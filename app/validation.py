@@ -0,0 +1,158 @@
+"""Проверка диапазонов файла реестра до загрузки в базу данных.
+Пересечения находятся сортировкой и одним проходом по диапазонам, поэтому
+ограничение исключения в базе не срабатывает на каждой строке, а
+отброшенные строки попадают в отчёт с причиной.
+"""
+import bisect
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .models import BLOCK_MP
+
+INVALID_RANGE = "invalid_range"
+OUT_OF_BLOCK = "out_of_block"
+DUPLICATE = "duplicate"
+OVERLAP = "overlap"
+
+
+class RangeValidator:
+    """Отбрасывает диапазоны, которые пересекаются с уже принятыми.
+    Принятые диапазоны файла хранятся отсортированными, порции
+    проверяются по мере чтения. Диапазон принимается, если не
+    пересекается с принятыми раньше по порядку файла.
+    """
+
+    def __init__(self, block: int = None, report: Path = None) -> None:
+        """Метод конструктора
+
+        :param block: Блок нумерации файла, без проверки если не указан
+        :type block: int, optional
+        :param report: Путь к отчёту об отброшенных строках
+        :type report: Path, optional
+        """
+        self.block = block
+        self.report = report
+        self.lowers = np.empty(0, dtype=np.int64)
+        self.uppers = np.empty(0, dtype=np.int64)
+        self.counts = {}
+        if report is not None and report.exists():
+            os.remove(report)
+
+    def check(self, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """Проверяет диапазоны порции и добавляет правильные к принятым
+
+        :param lower: Начала диапазонов в порядке файла
+        :type lower: np.ndarray
+        :param upper: Концы диапазонов (включительно)
+        :type upper: np.ndarray
+        :return: Причина отказа для каждого диапазона, None если принят
+        :rtype: np.ndarray
+        """
+        reasons = np.full(len(lower), None, dtype=object)
+        invalid = lower > upper
+        reasons[invalid] = INVALID_RANGE
+        if self.block is not None:
+            out_of_block = ~invalid & (
+                (lower // BLOCK_MP != self.block)
+                | (upper // BLOCK_MP != self.block)
+            )
+            reasons[out_of_block] = OUT_OF_BLOCK
+            invalid |= out_of_block
+        positions = np.flatnonzero(~invalid)
+
+        # Пересечения с диапазонами прежних порций. Принятые диапазоны
+        # не пересекаются, поэтому их концы тоже отсортированы.
+        lo, up = lower[positions], upper[positions]
+        hit = np.zeros(len(lo), dtype=bool)
+        if len(self.uppers):
+            found = np.minimum(
+                np.searchsorted(self.uppers, lo), len(self.uppers) - 1
+            )
+            hit = (self.uppers[found] >= lo) & (self.lowers[found] <= up)
+            same = (
+                hit & (self.lowers[found] == lo) & (self.uppers[found] == up)
+            )
+            reasons[positions[same]] = DUPLICATE
+            reasons[positions[hit & ~same]] = OVERLAP
+        positions, lo, up = positions[~hit], lo[~hit], up[~hit]
+
+        # Пересечения внутри порции. После сортировки по началу группа
+        # продолжается, пока начало не больше максимума концов до него;
+        # диапазон из группы в одну строку ни с чем не пересекается.
+        order = np.lexsort((positions, lo))
+        positions, lo, up = positions[order], lo[order], up[order]
+        starts = np.ones(len(lo), dtype=bool)
+        starts[1:] = lo[1:] > np.maximum.accumulate(up)[:-1]
+        bounds = np.append(np.flatnonzero(starts), len(lo))
+        accepted = np.ones(len(lo), dtype=bool)
+        for group in np.flatnonzero(np.diff(bounds) > 1).tolist():
+            self._sweep(
+                bounds[group],
+                bounds[group + 1],
+                positions,
+                lo,
+                up,
+                accepted,
+                reasons,
+            )
+
+        lowers = np.concatenate((self.lowers, lo[accepted]))
+        uppers = np.concatenate((self.uppers, up[accepted]))
+        order = np.argsort(lowers, kind="stable")
+        self.lowers, self.uppers = lowers[order], uppers[order]
+        rejected = reasons[pd.notna(reasons)]
+        for reason, count in zip(*np.unique(rejected, return_counts=True)):
+            self.counts[reason] = self.counts.get(reason, 0) + int(count)
+        return reasons
+
+    @staticmethod
+    def _sweep(begin, end, positions, lo, up, accepted, reasons) -> None:
+        """Проверяет группу пересекающихся диапазонов по порядку файла:
+        диапазон принимается, если не пересекается с уже принятыми, как
+        при вставке с ON CONFLICT DO NOTHING. Отброшенный диапазон не
+        мешает следующим.
+        """
+        # Принятые диапазоны группы не пересекаются, их начала и концы
+        # отсортированы одинаково.
+        lows, ups = [], []
+        for i in (begin + np.argsort(positions[begin:end])).tolist():
+            lower, upper = int(lo[i]), int(up[i])
+            j = bisect.bisect_left(ups, lower)
+            if j < len(ups) and lows[j] <= upper:
+                accepted[i] = False
+                same = lows[j] == lower and ups[j] == upper
+                reasons[positions[i]] = DUPLICATE if same else OVERLAP
+            else:
+                lows.insert(j, lower)
+                ups.insert(j, upper)
+
+    def validate(self, chunk: pd.DataFrame, batch: pd.DataFrame):
+        """Отбрасывает неправильные строки порции и дописывает их в отчёт
+
+        :param chunk: Исходные данные порции
+        :type chunk: pd.DataFrame
+        :param batch: Подготовленная порция со столбцами lower и upper
+        :type batch: pd.DataFrame
+        :return: Подготовленная порция без отброшенных строк
+        :rtype: pd.DataFrame
+        """
+        reasons = self.check(
+            batch["lower"].to_numpy(np.int64),
+            batch["upper"].to_numpy(np.int64),
+        )
+        rejected = pd.notna(reasons)
+        if not rejected.any():
+            return batch
+        if self.report is not None:
+            self.report.parent.mkdir(parents=True, exist_ok=True)
+            chunk[rejected].assign(reason=reasons[rejected]).to_csv(
+                self.report,
+                sep=";",
+                index=False,
+                mode="a",
+                header=not self.report.exists(),
+            )
+        return batch[~rejected].reset_index(drop=True)
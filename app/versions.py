@@ -0,0 +1,55 @@
+"""Версии блоков нумерации, по которым API узнаёт о новом импорте:
+ключи кэша поиска и ETag ответов содержат версию блока номера.
+"""
+import time
+
+import redis.asyncio as aioredis
+
+from .config import settings
+from .service import REGISTRY_VERSION_KEY, Parse
+
+
+class RegistryVersions:
+    """Версии блоков нумерации из Redis, перечитываются не чаще, чем раз
+    в lookup_cache_version_refresh секунд.
+    """
+
+    def __init__(self, db: int = 0) -> None:
+        """Метод конструктора
+
+        :param db: Номер базы в Redis, defaults to 0
+        :type db: int, optional
+        """
+        self.redis = aioredis.StrictRedis(
+            host=settings.redis_host,
+            encoding="utf-8",
+            decode_responses=True,
+            db=db,
+        )
+        self._versions = {}
+        self._read_at = 0.0
+
+    def invalidate(self) -> None:
+        """Перечитать версии при следующем обращении"""
+        self._read_at = 0.0
+
+    async def get(self) -> dict:
+        """Возвращает версии блоков нумерации
+
+        :return: Блок нумерации -> версия, 0 если блок не загружался
+        :rtype: dict
+        """
+        now = time.monotonic()
+        if now - self._read_at > settings.lookup_cache_version_refresh:
+            versions = await self.redis.mget(
+                [f"{REGISTRY_VERSION_KEY}:{block}" for block in Parse.BLOCKS]
+            )
+            self._versions = {
+                block: int(version or 0)
+                for block, version in zip(Parse.BLOCKS, versions)
+            }
+            self._read_at = now
+        return self._versions
+
+
+registry_versions = RegistryVersions()
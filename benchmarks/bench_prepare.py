@@ -0,0 +1,95 @@
+"""Сравнение построчной (прежней) и векторной подготовки порций файла
+реестра к загрузке.
+
+Запуск: python -m benchmarks.bench_prepare [файл или url] [размеры порций]
+"""
+import ssl
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.dialects.postgresql import Range
+
+from app.service import PREFIX_MP, Parse
+
+DEFAULT_FILE = Parse.REMOTE_URLS[3]
+DEFAULT_CHUNK_SIZES = [1000, 10000, 100000]
+
+
+def prepare_rowwise(chunk: pd.DataFrame) -> tuple:
+    """Подготовка порции в том виде, в каком она была до векторизации"""
+    chunk["ИНН"] = chunk["ИНН"].replace(np.nan, None)
+    operators = [
+        {"inn": x, "name": y}
+        for x, y in set(zip(chunk["ИНН"], chunk["Оператор"]))
+    ]
+    regions = [
+        {"name": x[0], "sub_name": ""}
+        if len(x) < 2
+        else {"name": x[1], "sub_name": x[0]}
+        for x in set(
+            tuple(x)
+            for x in map(lambda item: item.split("|"), chunk["Регион"])
+        )
+    ]
+    phones = [
+        {
+            "range": Range(
+                (pm := int(prefix * PREFIX_MP)) + int(start),
+                pm + int(end),
+                bounds="[]",
+            ),
+            "reg_name": reg_splitted[1]
+            if len(reg_splitted := region.split("|")) > 1
+            else reg_splitted[0],
+            "reg_sub_name": reg_splitted[0] if len(reg_splitted) > 1 else "",
+            "operator_inn": inn,
+            "operator_name": name,
+        }
+        for prefix, start, end, region, inn, name in zip(
+            chunk["АВС/ DEF"],
+            chunk["От"],
+            chunk["До"],
+            chunk["Регион"],
+            chunk["ИНН"],
+            chunk["Оператор"],
+        )
+    ]
+    return operators, regions, phones
+
+
+def prepare_vectorized(chunk: pd.DataFrame) -> tuple:
+    """Текущая подготовка порции: столбцы и drop_duplicates"""
+    batch = Parse._prepare_chunk(chunk)
+    operators = batch[["operator_inn", "operator_name"]].drop_duplicates()
+    regions = batch[["reg_name", "reg_sub_name"]].drop_duplicates()
+    return operators, regions, batch
+
+
+def measure(data: pd.DataFrame, chunk_size: int, prepare) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(data), chunk_size):
+        stop = start + chunk_size
+        prepare(data.iloc[start:stop].copy())
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    file_name = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FILE
+    chunk_sizes = [int(x) for x in sys.argv[2:]] or DEFAULT_CHUNK_SIZES
+    ssl._create_default_https_context = ssl._create_unverified_context
+    data = pd.read_csv(file_name, sep=";", on_bad_lines="skip")
+    print(f"{file_name}: {len(data)} строк")
+    for chunk_size in chunk_sizes:
+        rowwise = measure(data, chunk_size, prepare_rowwise)
+        vectorized = measure(data, chunk_size, prepare_vectorized)
+        print(
+            f"порция {chunk_size:>7}: построчно {rowwise:.3f} с, "
+            f"векторно {vectorized:.3f} с, "
+            f"ускорение x{rowwise / vectorized:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Набор бенчмарков импорта и поиска номеров на синтетическом реестре.
+Нужны локальные Postgres и Redis из настроек приложения: база
+test_postgres_db пересоздаётся, в Redis импорт пишет ETag, версии и
+метрики файла, как в рабочем режиме. Результаты сохраняются в JSON вместе
+с коммитом и настройками, файлы двух коммитов сравнивает
+benchmarks.compare.
+
+Запуск: python -m benchmarks.bench_suite [строк] [файл результатов]
+"""
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.dialects.postgresql import Range
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import crud
+from app.config import settings
+from app.database import DATABASE_URL
+from app.lookup import LookupIndex
+from app.models import BLOCK_MP, Base
+from app.service import PREFIX_MP, Parse
+from app.validation import RangeValidator
+from benchmarks.generate import generate_registry
+
+DEFAULT_ROWS = 500000
+BLOCK = 9
+# Режимы импорта: полная загрузка в пустую базу и повторная загрузка
+# того же файла поверх загруженного
+IMPORT_MODES = [
+    ("replace", "insert"),
+    ("replace", "copy"),
+    ("shadow", "copy"),
+    ("incremental", "copy"),
+]
+# База Redis бенчмарков: импорт пишет ETag, версии реестра и метрики
+# под url настоящих файлов, в рабочей базе 0 они подменили бы данные API
+REDIS_DB = 1
+LOOKUPS = 2000
+BATCH_SIZE = 1000
+BATCHES = 20
+
+
+class Results:
+    """Результаты бенчмарков в порядке запуска"""
+
+    def __init__(self) -> None:
+        """Метод конструктора"""
+        self.items = []
+
+    def add(self, name: str, seconds: float, rows: int = None, **extra):
+        """Добавляет результат и печатает его
+
+        :param name: Имя бенчмарка, по нему сравниваются прогоны
+        :type name: str
+        :param seconds: Время, сек
+        :type seconds: float
+        :param rows: Обработано строк или номеров, defaults to None
+        :type rows: int, optional
+        """
+        item = {"name": name, "seconds": round(seconds, 4)}
+        if rows is not None:
+            item["rows"] = rows
+            item["rows_per_second"] = round(rows / seconds, 1)
+        item.update(extra)
+        self.items.append(item)
+        print(json.dumps(item, ensure_ascii=False))
+
+
+def git_commit() -> str:
+    """Коммит рабочего дерева, с пометкой о незафиксированных изменениях"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+async def reset_database(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+def bench_stages(results: Results, path: Path) -> None:
+    """Стадии импорта без базы данных: чтение, подготовка и проверка"""
+    timings = {"read": 0.0, "prepare": 0.0, "validate": 0.0}
+    validator = RangeValidator(BLOCK)
+    rows = 0
+    started = time.perf_counter()
+    reader = pd.read_csv(
+        path,
+        sep=";",
+        chunksize=settings.import_chunk_size,
+        on_bad_lines="skip",
+    )
+    for chunk in reader:
+        timings["read"] += time.perf_counter() - started
+        started = time.perf_counter()
+        batch = Parse._prepare_chunk(chunk)
+        timings["prepare"] += time.perf_counter() - started
+        started = time.perf_counter()
+        validator.validate(chunk, batch)
+        timings["validate"] += time.perf_counter() - started
+        rows += len(chunk)
+        started = time.perf_counter()
+    for stage, seconds in timings.items():
+        results.add(f"stage.{stage}", seconds, rows)
+
+
+async def bench_import(
+    results: Results, engine: AsyncEngine, path: Path
+) -> None:
+    """Импорт файла целиком в каждом режиме и загрузчике"""
+    file_name = dict(zip(Parse.BLOCKS, Parse.REMOTE_URLS))[BLOCK]
+    for mode, loader in IMPORT_MODES:
+        settings.import_mode = mode
+        settings.import_loader = loader
+        parse = Parse(engine, db=REDIS_DB)
+        started = time.perf_counter()
+        await parse.parse_csv(file_name, source=path)
+        results.add(
+            f"import.{mode}.{loader}",
+            time.perf_counter() - started,
+            parse.rows,
+            stages={k: round(v, 4) for k, v in parse.timings.items()},
+        )
+
+
+async def bench_delete_range(results: Results, engine: AsyncEngine) -> None:
+    """Удаление диапазонов одного кода АВС/DEF, изменения откатываются"""
+    lower = (BLOCK * 100 + 50) * PREFIX_MP
+    async with engine.connect() as conn:
+        rows = len(await crud.get_ranges(conn, lower, lower + PREFIX_MP))
+        started = time.perf_counter()
+        await crud.delete_range(conn, Range(lower, lower + PREFIX_MP))
+        seconds = time.perf_counter() - started
+        await conn.rollback()
+    results.add("crud.delete_range", seconds, rows)
+
+
+def sample_numbers(ranges: np.ndarray, count: int, seed: int = 0) -> list[int]:
+    """Номера для поиска: половина из диапазонов, половина случайные
+    номера блока, часть которых попадает в незанятые интервалы
+    """
+    rng = np.random.default_rng(seed)
+    picked = ranges[rng.integers(0, len(ranges), count // 2)]
+    inside = picked[:, 0] + (
+        rng.random(len(picked)) * (picked[:, 1] - picked[:, 0])
+    ).astype(np.int64)
+    anywhere = rng.integers(BLOCK * BLOCK_MP, (BLOCK + 1) * BLOCK_MP, count)
+    nums = np.concatenate([inside, anywhere[: count - len(inside)]])
+    rng.shuffle(nums)
+    return nums.tolist()
+
+
+def latency(name: str, seconds: list[float]) -> dict:
+    return {
+        f"{name}_p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 3),
+        f"{name}_p99_ms": round(float(np.percentile(seconds, 99)) * 1000, 3),
+    }
+
+
+async def bench_lookups(results: Results, engine: AsyncEngine) -> None:
+    """Поиск номеров по одному, пакетами и в in-memory индексе"""
+    async with engine.connect() as conn:
+        ranges = np.array(await crud.get_ranges(conn), dtype=np.int64)
+    nums = sample_numbers(ranges, LOOKUPS)
+    async with engine.connect() as conn:
+        found, seconds = 0, []
+        for num in nums:
+            started = time.perf_counter()
+            found += await crud.get_info(conn, num) is not None
+            seconds.append(time.perf_counter() - started)
+        results.add(
+            "lookup.single",
+            sum(seconds),
+            len(nums),
+            found=found,
+            **latency("lookup", seconds),
+        )
+        batches = [
+            sample_numbers(ranges, BATCH_SIZE, seed)
+            for seed in range(1, BATCHES + 1)
+        ]
+        seconds = []
+        for batch in batches:
+            started = time.perf_counter()
+            await crud.get_info_batch(conn, batch)
+            seconds.append(time.perf_counter() - started)
+        results.add(
+            "lookup.batch",
+            sum(seconds),
+            BATCH_SIZE * BATCHES,
+            batch_size=BATCH_SIZE,
+            **latency("batch", seconds),
+        )
+    index = LookupIndex()
+    started = time.perf_counter()
+    await index.load(engine)
+    results.add("lookup.index_load", time.perf_counter() - started, len(index))
+    started = time.perf_counter()
+    for batch in batches:
+        index.find_many(batch)
+    results.add(
+        "lookup.index_batch",
+        time.perf_counter() - started,
+        BATCH_SIZE * BATCHES,
+    )
+
+
+async def run(rows: int, path: Path) -> dict:
+    engine = create_async_engine(
+        f"{DATABASE_URL.rsplit('/', 1)[0]}/{settings.test_postgres_db}",
+        poolclass=NullPool,
+    )
+    results = Results()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "registry.csv"
+        started = time.perf_counter()
+        lines = generate_registry(source, rows, BLOCK)
+        results.add("generate", time.perf_counter() - started, lines)
+        await reset_database(engine)
+        bench_stages(results, source)
+        await bench_import(results, engine, source)
+    await bench_delete_range(results, engine)
+    await bench_lookups(results, engine)
+    await engine.dispose()
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "rows": rows,
+        "python": platform.python_version(),
+        "settings": {
+            name: getattr(settings, name)
+            for name in (
+                "import_chunk_size",
+                "import_writers",
+                "import_queue_size",
+                "import_validate",
+            )
+        },
+        "results": results.items,
+    }
+    path.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    return report
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    path = Path(sys.argv[2] if len(sys.argv) > 2 else "bench-results.json")
+    asyncio.run(run(rows, path))
+    print(f"Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Сравнение результатов benchmarks.bench_suite двух прогонов, например
+до и после коммита. Код возврата 1, если какой-то бенчмарк замедлился
+больше порога.
+
+Запуск: python -m benchmarks.compare старый.json новый.json [порог, %]
+"""
+import json
+import sys
+
+DEFAULT_THRESHOLD = 10.0
+
+
+def load(path: str) -> tuple[dict, dict]:
+    with open(path) as file:
+        report = json.load(file)
+    return report, {item["name"]: item for item in report["results"]}
+
+
+def main() -> None:
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_THRESHOLD
+    old_report, old = load(sys.argv[1])
+    new_report, new = load(sys.argv[2])
+    print(f"{old_report['commit']} -> {new_report['commit']}")
+    if old_report["rows"] != new_report["rows"]:
+        print(
+            f"Внимание: разный размер реестра, {old_report['rows']} и "
+            f"{new_report['rows']} строк"
+        )
+    regressions = []
+    for name, item in new.items():
+        if name not in old or name == "generate":
+            continue
+        change = (item["seconds"] / old[name]["seconds"] - 1) * 100
+        mark = ""
+        if change > threshold:
+            mark = "  <- медленнее"
+            regressions.append(name)
+        print(
+            f"{name:<28} {old[name]['seconds']:>10.4f} с "
+            f"{item['seconds']:>10.4f} с {change:>+8.1f}%{mark}"
+        )
+    if regressions:
+        print(f"Замедление больше {threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
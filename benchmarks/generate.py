@@ -0,0 +1,168 @@
+"""Генератор синтетического файла реестра в формате Реестра российской
+системы и плана нумерации. Диапазоны идут по кодам блока без
+пересечений и с пропусками, операторы и регионы распределены неравномерно,
+как в настоящих файлах: у немногих крупных операторов большая часть
+диапазонов. Можно добавить пересекающиеся диапазоны и испорченные строки
+с лишними полями (pandas пропускает их по on_bad_lines="skip").
+
+Запуск: python -m benchmarks.generate файл строк [блок]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.models import PHONE_BLOCKS
+
+COLUMNS = ["АВС/ DEF", "От", "До", "Емкость", "Оператор", "Регион", "ИНН"]
+# Номеров в одном коде АВС/DEF
+CODE_SIZE = 10000000
+CHUNK_ROWS = 100000
+
+
+def make_operators(count: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Операторы с ИНН, у части операторов ИНН нет"""
+    inn = rng.choice(9000000000, count, replace=False) + 1000000000
+    return pd.DataFrame(
+        {
+            "Оператор": [f'ООО "Оператор связи {i}"' for i in range(count)],
+            "ИНН": np.where(rng.random(count) < 0.01, None, inn),
+        }
+    )
+
+
+def make_regions(count: int, rng: np.random.Generator) -> np.ndarray:
+    """Регионы "Регион" и "Подрегион|Регион" примерно поровну"""
+    names = [f"Регион {i}" for i in range(max(count // 4, 1))]
+    regions = [
+        names[i % len(names)]
+        if rng.random() < 0.5
+        else f"г. Город {i}|{names[i % len(names)]}"
+        for i in range(count)
+    ]
+    return np.array(regions, dtype=object)
+
+
+def skewed_choice(
+    count: int, size: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Номера от 0 до count с распределением Ципфа"""
+    weights = 1 / np.arange(1, count + 1)
+    return rng.choice(count, size, p=weights / weights.sum())
+
+
+def make_ranges(
+    rows: int, block: int, rng: np.random.Generator
+) -> pd.DataFrame:
+    """Непересекающиеся диапазоны по кодам блока. У 10% диапазонов
+    конец отступает, оставляя незанятые номера.
+    """
+    codes = np.arange(block * 100, block * 100 + 100)
+    per_code = np.bincount(rng.integers(0, len(codes), rows), minlength=100)
+    frames = []
+    for code, count in zip(codes, per_code.tolist()):
+        if not count:
+            continue
+        # Концы count + 1 отрезков, на которые делится код
+        cuts = np.sort(rng.choice(CODE_SIZE - 1, count, replace=False)) + 1
+        starts = np.append(0, cuts[:-1])
+        ends = cuts - 1
+        short = rng.random(count) < 0.1
+        ends[short] = starts[short] + (ends[short] - starts[short]) // 2
+        frames.append(
+            pd.DataFrame({"АВС/ DEF": code, "От": starts, "До": ends})
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def add_overlaps(
+    data: pd.DataFrame, share: float, rng: np.random.Generator
+) -> pd.DataFrame:
+    """Добавляет после случайных диапазонов копии со сдвигом, которые
+    пересекаются с исходным диапазоном
+    """
+    picked = np.flatnonzero(rng.random(len(data)) < share)
+    copies = data.iloc[picked].copy()
+    shift = (copies["До"] - copies["От"]) // 2
+    copies["От"] += shift
+    copies["До"] = np.minimum(copies["До"] + shift, CODE_SIZE - 1)
+    order = np.concatenate([np.arange(len(data)), picked + 0.5])
+    data = pd.concat([data, copies], ignore_index=True)
+    return data.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+
+
+def generate_registry(
+    path: str,
+    rows: int,
+    block: int = 9,
+    operators: int = 900,
+    regions: int = 400,
+    overlaps: float = 0.001,
+    malformed: float = 0.0005,
+    seed: int = 0,
+) -> int:
+    """Записывает синтетический файл реестра
+
+    :param path: Путь к файлу
+    :type path: str
+    :param rows: Число диапазонов без пересекающихся копий
+    :type rows: int
+    :param block: Блок нумерации (3, 4, 8 или 9), defaults to 9
+    :type block: int, optional
+    :param operators: Число операторов, defaults to 900
+    :type operators: int, optional
+    :param regions: Число пар регион-подрегион, defaults to 400
+    :type regions: int, optional
+    :param overlaps: Доля пересекающихся копий, defaults to 0.001
+    :type overlaps: float, optional
+    :param malformed: Доля испорченных строк, defaults to 0.0005
+    :type malformed: float, optional
+    :param seed: Зерно генератора: файл с тем же зерном совпадает
+        побайтно, defaults to 0
+    :type seed: int, optional
+    :return: Число строк файла без заголовка
+    :rtype: int
+    """
+    if block not in PHONE_BLOCKS:
+        raise ValueError(f"Блок {block} не из {PHONE_BLOCKS}")
+    rng = np.random.default_rng(seed)
+    data = add_overlaps(make_ranges(rows, block, rng), overlaps, rng)
+    data["Емкость"] = data["До"] - data["От"] + 1
+    owners = make_operators(operators, rng).iloc[
+        skewed_choice(operators, len(data), rng)
+    ]
+    data["Оператор"] = owners["Оператор"].to_numpy()
+    data["ИНН"] = owners["ИНН"].to_numpy()
+    data["Регион"] = make_regions(regions, rng)[
+        skewed_choice(regions, len(data), rng)
+    ]
+    data = data[COLUMNS]
+    bad = rng.random(len(data)) < malformed
+    lines = 0
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(";".join(COLUMNS) + "\n")
+        for start in range(0, len(data), CHUNK_ROWS):
+            stop = start + CHUNK_ROWS
+            text = data.iloc[start:stop].to_csv(
+                sep=";", header=False, index=False
+            )
+            chunk = text.splitlines()
+            for i in np.flatnonzero(bad[start:stop]).tolist():
+                # Лишнее поле: строку отбросит on_bad_lines="skip"
+                chunk[i] += ";лишнее поле"
+            file.write("\n".join(chunk) + "\n")
+            lines += len(chunk)
+    return lines
+
+
+def main() -> None:
+    path, rows = sys.argv[1], int(sys.argv[2])
+    block = int(sys.argv[3]) if len(sys.argv) > 3 else 9
+    started = time.perf_counter()
+    lines = generate_registry(path, rows, block)
+    print(f"{path}: {lines} строк за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""Нагрузочный тест поиска номера GET /api/{phone_num}. Приложение
+запускается в этом же процессе (вместе с событиями startup, поэтому
+учитываются настройки lookup_backend, пула и кэша из .env) или
+нагружается по http. Номера берутся из загруженных диапазонов, которые
+читаются через /api/ranges: горячее множество, равномерно по всем
+диапазонам, промахи в незанятых интервалах и некорректные номера.
+Смесь номеров зависит только от зерна, поэтому прогоны с разными
+бэкендами и настройками пула сравнимы.
+
+Запуск: python -m benchmarks.load [--url http://localhost:8000]
+    [--concurrency 1,16,64] [--duration 30 | --requests 100000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+from app.config import settings
+from app.models import BLOCK_MP, PHONE_BLOCKS
+from benchmarks.bench_suite import git_commit
+
+# Границы корзин гистограммы задержек, мс
+BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+# Ожидаемый статус ответа для каждого вида номера
+EXPECTED = {"hot": 200, "hit": 200, "miss": 404, "invalid": 422}
+INVALID = ["7916123", "79a61234567", "71234567890", "7916123456789"]
+
+
+async def load_ranges(client: httpx.AsyncClient) -> np.ndarray:
+    """Читает загруженные диапазоны через /api/ranges
+
+    :param client: Клиент API
+    :type client: httpx.AsyncClient
+    :return: Начала и концы (включительно) десятизначных номеров
+    :rtype: np.ndarray
+    """
+    rows = []
+    async with client.stream("GET", "/api/ranges") as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                item = json.loads(line)
+                rows.append((int(item["start"][1:]), int(item["end"][1:])))
+    if not rows:
+        raise SystemExit("Реестр пуст: сначала загрузите файлы")
+    return np.array(rows, dtype=np.int64)
+
+
+def make_mix(ranges: np.ndarray, args: argparse.Namespace) -> list:
+    """Готовит последовательность запросов
+
+    :param ranges: Загруженные диапазоны
+    :type ranges: np.ndarray
+    :param args: Параметры запуска
+    :type args: argparse.Namespace
+    :return: Пары (вид номера, номер)
+    :rtype: list[tuple[str, str]]
+    """
+    rng = np.random.default_rng(args.seed)
+    size = args.mix_size
+
+    def inside(count: int) -> np.ndarray:
+        picked = ranges[rng.integers(0, len(ranges), count)]
+        offsets = rng.random(count) * (picked[:, 1] - picked[:, 0] + 1)
+        return picked[:, 0] + offsets.astype(np.int64)
+
+    def outside(count: int) -> np.ndarray:
+        # Случайные номера блоков, кроме попавших в диапазоны
+        nums = np.empty(0, dtype=np.int64)
+        while len(nums) < count:
+            blocks = rng.choice(PHONE_BLOCKS, count)
+            candidates = blocks * BLOCK_MP + rng.integers(0, BLOCK_MP, count)
+            i = np.searchsorted(ranges[:, 0], candidates, side="right") - 1
+            covered = (i >= 0) & (candidates <= ranges[i.clip(0), 1])
+            nums = np.concatenate([nums, candidates[~covered]])
+        return nums[:count]
+
+    kinds = rng.choice(
+        ["invalid", "miss", "hot", "hit"],
+        size,
+        p=[
+            args.invalid_share,
+            args.miss_share,
+            (1 - args.invalid_share - args.miss_share) * args.hot_share,
+            (1 - args.invalid_share - args.miss_share) * (1 - args.hot_share),
+        ],
+    )
+    hot_set = inside(args.hot_size)
+    nums = {
+        "hot": hot_set[rng.integers(0, len(hot_set), size)],
+        "hit": inside(size),
+        "miss": outside(size),
+    }
+    mix = []
+    for i, kind in enumerate(kinds.tolist()):
+        if kind == "invalid":
+            mix.append((kind, INVALID[i % len(INVALID)]))
+        else:
+            mix.append((kind, f"7{nums[kind][i]}"))
+    return mix
+
+
+class Stats:
+    """Задержки и исходы запросов одного прогона"""
+
+    def __init__(self) -> None:
+        """Метод конструктора"""
+        self.latencies = []
+        self.outcomes = {}
+
+    def add(self, kind: str, outcome, seconds: float) -> None:
+        """Учитывает запрос
+
+        :param kind: Вид номера
+        :type kind: str
+        :param outcome: Статус ответа или имя исключения
+        :type outcome: int | str
+        :param seconds: Задержка, сек
+        :type seconds: float
+        """
+        self.latencies.append(seconds)
+        key = f"{kind}:{outcome}"
+        self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def report(self, concurrency: int, elapsed: float) -> dict:
+        """Сводка прогона
+
+        :param concurrency: Число одновременных запросов
+        :type concurrency: int
+        :param elapsed: Длительность прогона, сек
+        :type elapsed: float
+        :return: Пропускная способность, перцентили, гистограмма и
+            разбивка исходов
+        :rtype: dict
+        """
+        ms = np.array(self.latencies) * 1000
+        counts = np.bincount(
+            np.searchsorted(BUCKETS, ms), minlength=len(BUCKETS) + 1
+        )
+        errors = {
+            key: count
+            for key, count in self.outcomes.items()
+            if key.split(":")[1] != str(EXPECTED[key.split(":")[0]])
+        }
+        return {
+            "concurrency": concurrency,
+            "requests": len(ms),
+            "seconds": round(elapsed, 3),
+            "rps": round(len(ms) / elapsed, 1),
+            **{
+                f"p{q}_ms": round(float(np.percentile(ms, q)), 3)
+                for q in (50, 90, 99, 99.9)
+            },
+            "max_ms": round(float(ms.max()), 3),
+            "histogram_ms": {
+                f"<={bound}": count
+                for bound, count in zip((*BUCKETS, "inf"), counts.tolist())
+            },
+            "outcomes": self.outcomes,
+            "errors": errors,
+        }
+
+
+async def run_step(
+    client: httpx.AsyncClient,
+    mix: list,
+    concurrency: int,
+    duration: float,
+    requests: int,
+) -> dict:
+    """Прогон с постоянным числом одновременных запросов
+
+    :param client: Клиент API
+    :type client: httpx.AsyncClient
+    :param mix: Последовательность запросов, повторяется по кругу
+    :type mix: list
+    :param concurrency: Число одновременных запросов
+    :type concurrency: int
+    :param duration: Длительность, сек, если не задано requests
+    :type duration: float
+    :param requests: Число запросов
+    :type requests: int
+    :return: Сводка прогона
+    :rtype: dict
+    """
+    stats = Stats()
+    sent = 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker():
+        nonlocal sent
+        while True:
+            if requests:
+                if sent >= requests:
+                    return
+            elif time.perf_counter() >= deadline:
+                return
+            kind, phone_num = mix[sent % len(mix)]
+            sent += 1
+            began = time.perf_counter()
+            try:
+                response = await client.get(f"/api/{phone_num}")
+                outcome = response.status_code
+            except httpx.HTTPError as err:
+                outcome = type(err).__name__
+            stats.add(kind, outcome, time.perf_counter() - began)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return stats.report(concurrency, time.perf_counter() - started)
+
+
+def print_step(step: dict) -> None:
+    print(
+        f"concurrency {step['concurrency']:>4}: {step['rps']:>9.1f} rps, "
+        f"p50 {step['p50_ms']:.2f} мс, p99 {step['p99_ms']:.2f} мс, "
+        f"max {step['max_ms']:.2f} мс, ошибок "
+        f"{sum(step['errors'].values())}"
+    )
+    peak = max(step["histogram_ms"].values())
+    for bound, count in step["histogram_ms"].items():
+        bar = "#" * round(40 * count / peak) if peak else ""
+        print(f"  {bound:>8} мс {count:>9} {bar}")
+    for key, count in step["errors"].items():
+        print(f"  ошибка {key}: {count}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(
+            base_url=args.url,
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=max(args.concurrency)),
+        )
+    else:
+        from main import app
+
+        await app.router.startup()
+        client = httpx.AsyncClient(
+            app=app, base_url="http://test", timeout=args.timeout
+        )
+    async with client:
+        ranges = await load_ranges(client)
+        mix = make_mix(ranges, args)
+        steps = []
+        for concurrency in args.concurrency:
+            step = await run_step(
+                client, mix, concurrency, args.duration, args.requests
+            )
+            print_step(step)
+            steps.append(step)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "target": args.url or "in-process",
+        "label": args.label,
+        "ranges": len(ranges),
+        "mix": {
+            "seed": args.seed,
+            "hot_size": args.hot_size,
+            "hot_share": args.hot_share,
+            "miss_share": args.miss_share,
+            "invalid_share": args.invalid_share,
+        },
+        "steps": steps,
+    }
+    if app is not None:
+        report["settings"] = {
+            name: getattr(settings, name)
+            for name in (
+                "lookup_backend",
+                "lookup_cache",
+                "lookup_coalesce",
+                "gap_index",
+                "db_pooled",
+                "db_pool_size",
+                "db_max_overflow",
+                "db_statement_cache_size",
+            )
+        }
+        await app.router.shutdown()
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--url", help="адрес API; без него приложение запускается в процессе"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(x) for x in value.split(",")],
+        default=[16],
+        help="одновременных запросов, через запятую для нескольких прогонов",
+    )
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument(
+        "--requests", type=int, default=0, help="запросов вместо duration"
+    )
+    parser.add_argument("--hot-size", type=int, default=1000)
+    parser.add_argument("--hot-share", type=float, default=0.8)
+    parser.add_argument("--miss-share", type=float, default=0.1)
+    parser.add_argument("--invalid-share", type=float, default=0.02)
+    parser.add_argument("--mix-size", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--label", help="метка прогона в результатах")
+    parser.add_argument("--output", help="файл результатов JSON")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"Результаты: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,20 @@
+import asyncio
+from pathlib import Path
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.cache import lookup_cache
+from app.coalescer import lookup_coalescer
+from app.config import settings
+from app.database import engine
+from app.gaps import gap_index
+from app.lookup import lookup_index
+from app.metrics import MetricsEndpoint, MetricsMiddleware
+from app.replicas import replica_router
 from app.router import router
+from app.service import Parse
+from app.tasks import celery_write_snapshot
 
 app = FastAPI()
 
@@ -18,4 +31,60 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 app.include_router(router)
+
+
+def collect_metrics() -> list:
+    return (
+        lookup_cache.metrics()
+        + lookup_coalescer.metrics()
+        + replica_router.metrics()
+    )
+
+
+metrics = MetricsEndpoint(Parse.REMOTE_URLS, collect_metrics)
+app.add_route("/metrics", metrics.handle, include_in_schema=False)
+
+
+@app.on_event("startup")
+async def startup():
+    if replica_router.replicas:
+        # До первой проверки все сессии идут в основную базу
+        await replica_router.check()
+        app.state.replica_watcher = asyncio.create_task(
+            replica_router.watch(settings.db_replica_check_interval)
+        )
+    if settings.lookup_backend == "memory":
+        await lookup_index.load(
+            engine, await asyncio.to_thread(Parse.get_redis_version)
+        )
+        app.state.registry_watcher = asyncio.create_task(
+            lookup_index.watch(engine, settings.registry_watch_interval)
+        )
+    elif settings.lookup_backend == "snapshot":
+        path = Path(settings.registry_snapshot)
+        if path.exists():
+            lookup_index.load_snapshot(path)
+        else:
+            # До появления снимка поиск идёт запросами в базу
+            celery_write_snapshot.delay()
+        app.state.registry_watcher = asyncio.create_task(
+            lookup_index.watch_snapshot(path, settings.registry_watch_interval)
+        )
+    elif settings.gap_index:
+        await gap_index.load(
+            engine, await asyncio.to_thread(Parse.get_redis_version)
+        )
+        app.state.gap_watcher = asyncio.create_task(
+            gap_index.watch(engine, settings.registry_watch_interval)
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for name in ("registry_watcher", "gap_watcher", "replica_watcher"):
+        watcher = getattr(app.state, name, None)
+        if watcher:
+            watcher.cancel()
+    await replica_router.dispose()